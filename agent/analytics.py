@@ -0,0 +1,170 @@
+import threading
+
+import numpy as np
+import pandas as pd
+from langchain_core.tools import StructuredTool
+from config import settings
+from query_filter import canonical_crop_type, canonical_state
+from schema import CropDataQuery
+
+METRICS = ("production", "planted_area", "yield")
+GROUP_COLUMNS = ("state", "year", "crop_type")
+AGGREGATIONS = ("sum", "mean", "min", "max", "count")
+NATIONAL_TOTAL = "Malaysia" # national aggregate rows, not a state
+ALIASES = {"state": canonical_state, "crop_type": canonical_crop_type} # 'penang', 'rice', ...
+
+
+def _normalize(value):
+    return str(value).strip().lower().replace("_", " ").replace("-", " ")
+
+
+class CropTable:
+    """DOSM crop table loaded once, typed columns with pre-built row indexes on state, year and crop_type"""
+
+    def __init__(self, csv_path):
+        df = pd.read_csv(csv_path, dtype={"state": "category", "crop_type": "category"}, parse_dates=["date"])
+        df["year"] = df["date"].dt.year.astype("int16")
+        df["planted_area"] = df["planted_area"].astype("float64")
+        df["production"] = df["production"].astype("float64")
+        df["yield"] = (df["production"] / df["planted_area"]).replace([np.inf, -np.inf], np.nan) # tonnes per hectare
+        self.df = df
+
+        # value -> row positions, filters are index intersections instead of full scans
+        self.indexes = {
+            column: {value: rows for value, rows in df.groupby(column, observed=True).indices.items()}
+            for column in GROUP_COLUMNS
+        }
+        self.lookup = {
+            column: {_normalize(value): value for value in self.indexes[column]}
+            for column in ("state", "crop_type")
+        }
+
+    def _rows(self, column, values):
+        rows = [self.indexes[column][value] for value in values if value in self.indexes[column]]
+        return np.concatenate(rows) if rows else np.array([], dtype=np.int64)
+
+    def resolve(self, column, names):
+        """Map user spellings ('industrial crops', 'kedah') to the stored values, unknown names are dropped"""
+        resolved = []
+        for name in names or []:
+            value = self.lookup[column].get(_normalize(name)) or ALIASES[column](name)
+            if value is not None and value not in resolved:
+                resolved.append(value)
+        return resolved
+
+    def select(self, states=None, years=None, crop_types=None):
+        """Rows matching all filters, Malaysia national totals excluded unless asked for explicitly"""
+        positions = np.arange(len(self.df))
+        if states:
+            positions = np.intersect1d(positions, self._rows("state", states))
+        else:
+            national = self.indexes["state"].get(NATIONAL_TOTAL, np.array([], dtype=np.int64))
+            positions = np.setdiff1d(positions, national)
+        if years is not None:
+            positions = np.intersect1d(positions, self._rows("year", years))
+        if crop_types:
+            positions = np.intersect1d(positions, self._rows("crop_type", crop_types))
+        return self.df.iloc[positions]
+
+    def query(self, states=None, year_from=None, year_to=None, crop_types=None, metric="production",
+              group_by=None, aggregation="sum", order="desc", top_n=None, rolling_window=None):
+        """Filter, group, aggregate, rank and roll; returns a small DataFrame"""
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {METRICS}")
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"aggregation must be one of {AGGREGATIONS}")
+        group_by = [column for column in (group_by or []) if column in GROUP_COLUMNS]
+
+        years = None
+        if year_from is not None or year_to is not None:
+            first = year_from if year_from is not None else min(self.indexes["year"])
+            last = year_to if year_to is not None else max(self.indexes["year"])
+            years = list(range(first, last + 1))
+
+        resolved_states = self.resolve("state", states)
+        resolved_crop_types = self.resolve("crop_type", crop_types)
+        if (states and not resolved_states) or (crop_types and not resolved_crop_types):
+            return pd.DataFrame() # only unknown names given, do not fall back to the whole table
+
+        rows = self.select(resolved_states, years, resolved_crop_types)
+        if rows.empty:
+            return pd.DataFrame()
+
+        if metric == "yield" and aggregation == "sum":
+            # yield does not add up, recompute it from the grouped totals
+            if group_by:
+                result = rows.groupby(group_by, observed=True)[["production", "planted_area"]].sum().reset_index()
+            else:
+                result = rows[["production", "planted_area"]].sum().to_frame().T
+            result["yield"] = result["production"] / result["planted_area"]
+            result = result.drop(columns=["production", "planted_area"])
+        elif group_by:
+            result = rows.groupby(group_by, observed=True)[metric].agg(aggregation).reset_index()
+        else:
+            result = pd.DataFrame({metric: [rows[metric].agg(aggregation)]})
+        value_column = metric
+
+        if rolling_window and "year" in group_by:
+            keys = [column for column in group_by if column != "year"]
+            result = result.sort_values(keys + ["year"])
+            rolling_column = f"{metric}_{rolling_window}y_avg"
+            if keys:
+                result[rolling_column] = result.groupby(keys, observed=True)[metric].transform(
+                    lambda values: values.rolling(rolling_window, min_periods=rolling_window).mean()
+                )
+            else:
+                result[rolling_column] = result[metric].rolling(rolling_window, min_periods=rolling_window).mean()
+            result = result.dropna(subset=[rolling_column])
+            value_column = rolling_column
+
+        if order in ("asc", "desc"):
+            result = result.sort_values(value_column, ascending=order == "asc")
+        if top_n:
+            result = result.head(top_n)
+        return result.reset_index(drop=True)
+
+
+def format_table(result, max_rows=settings.ANALYTICS_MAX_ROWS):
+    """Compact pipe table for prompts"""
+    if result.empty:
+        return "No matching rows in the dataset."
+
+    lines = [" | ".join(result.columns)]
+    for row in result.head(max_rows).itertuples(index=False):
+        lines.append(" | ".join(f"{value:.1f}" if isinstance(value, float) else str(value) for value in row))
+    if len(result) > max_rows:
+        lines.append(f"... {len(result) - max_rows} more rows")
+    return "\n".join(lines)
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_crop_table():
+    """CropTable singleton, loaded on first call"""
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = CropTable(settings.DATASET_CSV_PATH)
+    return _table
+
+
+def crop_data_query(**query):
+    """Exact query over the DOSM crop table: filter by state/year/crop type, group, aggregate, rank, moving average"""
+    try:
+        return format_table(get_crop_table().query(**query))
+    except ValueError as e:
+        return f"Invalid query: {e}"
+
+
+crop_data_tool = StructuredTool.from_function(
+    func=crop_data_query,
+    name="crop_data_query",
+    description=(
+        "Run an exact query over the Malaysia crop production and planted area table by state (2017-2022). "
+        "Use for totals, averages, highest/lowest rankings, comparisons and moving averages."
+    ),
+    args_schema=CropDataQuery,
+)
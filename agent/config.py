@@ -3,6 +3,15 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+
+def _choice(name, default, choices):
+    """Enumerated setting, a wrong value fails at startup with the allowed ones"""
+    value = os.getenv(name, default).strip().lower()
+    if value not in choices:
+        raise ValueError(f"{name}={value!r} is not valid, expected one of: {', '.join(choices)}")
+    return value
+
+
 class Settings:
     # llm
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
@@ -11,11 +20,132 @@ class Settings:
     ZILLIZ_URL = os.getenv("ZILLIZ_URL", "")
     ZILLIZ_TOKEN = os.getenv("ZILLIZ_TOKEN", "")
     COLLECTION_NAME = "crop_by_state_data_malaysia"
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "milvus") # "milvus" (Zilliz Cloud) or "local"
+    LOCAL_VECTOR_DIR = "./database/vector-store" # build with: uv run agent/vector_store.py
+    LOCAL_FAISS_MIN_ROWS = 50000 # HNSW index above this size (if faiss installed), exact search below
+    DATASET_CSV_PATH = "./database/data-collection/crops_state (1).csv"
+    ANALYTICS_MAX_ROWS = 50 # rows of a crop_data_query result put in the prompt
+    
+    # embedding model + query embedding cache
+    EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch") # "torch" or "onnx" (onnxruntime, no torch)
+    ONNX_MODEL_DIR = "./database/onnx-model" # export with: uv run agent/onnx_embeddings.py export
+    ONNX_QUANTIZED = os.getenv("ONNX_QUANTIZED", "true").lower() == "true" # int8 dynamic quantization
+    ONNX_THREADS = int(os.getenv("ONNX_THREADS", "2"))
+    EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true" # disk tier
+    EMBEDDING_CACHE_PATH = "./database/cache/embeddings.sqlite3"
+    EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024")) # in-memory LRU entries
+    
+    # retriever thread pools / timeouts (seconds)
+    EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", "2")) # cpu bound, keep small
+    SEARCH_MAX_WORKERS = int(os.getenv("SEARCH_MAX_WORKERS", "8")) # network bound
+    EMBED_TIMEOUT = float(os.getenv("EMBED_TIMEOUT", "30"))
+    SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "10"))
+    
+    # hybrid retrieval: BM25 over the chunk text fused with dense search (reciprocal rank fusion)
+    HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+    LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "./database/lexical-index.json")
+    DENSE_WEIGHT = float(os.getenv("DENSE_WEIGHT", "1.0"))
+    LEXICAL_WEIGHT = float(os.getenv("LEXICAL_WEIGHT", "1.0"))
+    RRF_K = int(os.getenv("RRF_K", "60"))
+    HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "30")) # depth fetched from each retriever before fusion
+    
+    # llm call cache for nodes that are pure functions of their prompt
+    LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory") # memory | sqlite | none
+    LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./database/cache/llm.sqlite3")
+    LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "2048")) # in-memory LRU entries
+    LLM_CACHE_NODES = os.getenv(
+        "LLM_CACHE_NODES", "guard_rail_messages,semantic_optimizer_filter,guard_rail_answer,hallucination_calculator"
+    ).split(",")
+    
+    # run the input guard rail concurrently with query optimization and retrieval
+    SPECULATIVE_INPUT_ENABLED = os.getenv("SPECULATIVE_INPUT_ENABLED", "true").lower() == "true"
+    
+    # post-answer checks (evaluation, hallucination score, output guard rail)
+    POST_CHECKS_MODE = _choice("POST_CHECKS_MODE", "parallel", ("parallel", "background", "sequential"))
+    EVALUATION_MIN_CONFIDENCE = float(os.getenv("EVALUATION_MIN_CONFIDENCE", "0.6")) # below it a draft is retried
+    HALLUCINATION_MIN_SCORE = float(os.getenv("HALLUCINATION_MIN_SCORE", "0.6")) # below it the answer is flagged
+    
+    # local input pre-classifier in front of the llm guard rail
+    INPUT_CLASSIFIER_ENABLED = os.getenv("INPUT_CLASSIFIER_ENABLED", "true").lower() == "true"
+    INPUT_CLASSIFIER_ALLOW_MARGIN = float(os.getenv("INPUT_CLASSIFIER_ALLOW_MARGIN", "0.15")) # cos(allow) - cos(deny)
+    INPUT_CLASSIFIER_DENY_MARGIN = float(os.getenv("INPUT_CLASSIFIER_DENY_MARGIN", "0.15"))
+    
+    # semantic answer cache (near-duplicate questions skip the graph)
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "./database/cache/answers.sqlite3")
+    ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")) # cosine similarity
+    ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600))) # seconds
+    ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+    ANSWER_CACHE_MIN_WORDS = int(os.getenv("ANSWER_CACHE_MIN_WORDS", "4")) # shorter messages are follow-ups
+    DATASET_VERSION = os.getenv("DATASET_VERSION", "") # defaults to a hash of DATASET_CSV_PATH
+    
+    # stream answer tokens and tool progress to the chat UI
+    STREAMING_ENABLED = os.getenv("STREAMING_ENABLED", "true").lower() == "true"
+    
+    # retrieved docs in prompts: compact table under a token budget per node
+    CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "o200k_base") # tiktoken encoding of the chat model
+    DOCS_CONTEXT_BUDGET = int(os.getenv("DOCS_CONTEXT_BUDGET", "800")) # tokens, nodes without their own budget
+    DOCS_CONTEXT_BUDGETS = {
+        node: int(budget) for node, budget in (
+            item.split(":") for item in os.getenv(
+                "DOCS_CONTEXT_BUDGETS",
+                "answer_generator:1200,evaluation:800,hallucination_calculator:800,csv_generator:1200,chart_generator:1200"
+            ).split(",") if item
+        )
+    }
+    
+    # conversation memory: last turns verbatim, older turns folded into a digest
+    MEMORY_WINDOW_TURNS = int(os.getenv("MEMORY_WINDOW_TURNS", "3"))
+    MEMORY_SUMMARY_MODE = os.getenv("MEMORY_SUMMARY_MODE", "extractive") # extractive | llm | none
+    MEMORY_SUMMARY_MAX_CHARS = int(os.getenv("MEMORY_SUMMARY_MAX_CHARS", "1500"))
+    
+    # query / answer event log (JSONL), written by a background thread
+    EVENT_LOG_PATH = os.getenv("EVENT_LOG_PATH", "") # defaults to eval/query_answer_result.jsonl
+    EVENT_LOG_FLUSH_INTERVAL = float(os.getenv("EVENT_LOG_FLUSH_INTERVAL", "1.0")) # seconds
+    EVENT_LOG_BATCH_SIZE = int(os.getenv("EVENT_LOG_BATCH_SIZE", "100"))
+    EVENT_LOG_MAX_BYTES = int(os.getenv("EVENT_LOG_MAX_BYTES", str(50 * 1024 * 1024))) # rotate above this size
+    EVENT_LOG_ROTATE_INTERVAL = int(os.getenv("EVENT_LOG_ROTATE_INTERVAL", str(24 * 3600))) # seconds, 0 = size only
+    EVENT_LOG_COMPRESS = os.getenv("EVENT_LOG_COMPRESS", "true").lower() == "true" # gzip rotated files
+    
+    # per-node instrumentation: latency quantiles, llm calls, tokens, cost (GET /metrics + JSONL)
+    METRICS_JSONL_PATH = os.getenv("METRICS_JSONL_PATH", "./eval/node_metrics.jsonl") # empty to disable
+    METRICS_RESERVOIR = int(os.getenv("METRICS_RESERVOIR", "1000")) # recent runs per node behind the quantiles
+    LLM_PRICE_INPUT_PER_MTOK = float(os.getenv("LLM_PRICE_INPUT_PER_MTOK", "0.40")) # USD, gpt-4.1-mini
+    LLM_PRICE_OUTPUT_PER_MTOK = float(os.getenv("LLM_PRICE_OUTPUT_PER_MTOK", "1.60"))
+    
+    # record / replay of llm requests and MCP tool calls (offline profiling with identical inputs)
+    CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off") # off | record | replay
+    CASSETTE_PATH = os.getenv("CASSETTE_PATH", "./eval/cassettes/cassette.jsonl.gz")
+    CASSETTE_REPLAY_LATENCY = os.getenv("CASSETTE_REPLAY_LATENCY", "false").lower() == "true" # sleep the recorded latency
+    
+    # session memory: one checkpointer thread per browser session
+    CHECKPOINT_BACKEND = os.getenv("CHECKPOINT_BACKEND", "memory") # memory (single process) | sqlite (shared by workers)
+    CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", "./database/sessions/checkpoints.sqlite3")
+    CHECKPOINT_MAX_THREADS = int(os.getenv("CHECKPOINT_MAX_THREADS", "1000")) # memory backend, least recently used evicted first
+    CHECKPOINT_THREAD_TTL = int(os.getenv("CHECKPOINT_THREAD_TTL", str(3600))) # idle seconds before a session is dropped
+    CHECKPOINT_MAX_PER_THREAD = int(os.getenv("CHECKPOINT_MAX_PER_THREAD", "20")) # latest checkpoints kept per session
+    
+    # server: one long-lived event loop shared by all sessions
+    SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+    SERVER_PORT = int(os.getenv("SERVER_PORT", "7860"))
+    CHAT_CONCURRENCY_LIMIT = int(os.getenv("CHAT_CONCURRENCY_LIMIT", "8")) # graph runs in flight
+    CHAT_QUEUE_SIZE = int(os.getenv("CHAT_QUEUE_SIZE", "64")) # waiting requests before new ones are rejected
+    
+    # startup
+    WARM_UP_ON_START = os.getenv("WARM_UP_ON_START", "true").lower() == "true" # load embedding model in background
+    IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "3")) # seconds to import the graph
     
     # MCP_MEMORY_DIR = "./database/user-database"
     TAVILY_API_KEY = os.getenv("TAVILY_API_KEY", "")
     
     CSV_GEN_OUTPUT_DIR = "./database/user-database"
+    
+    # MCP session pool
+    MCP_STARTUP_TIMEOUT = float(os.getenv("MCP_STARTUP_TIMEOUT", "60")) # seconds, npx/uv cold start
+    MCP_HEALTHCHECK_INTERVAL = float(os.getenv("MCP_HEALTHCHECK_INTERVAL", "30")) # seconds between pings
+    MCP_HEALTHCHECK_TIMEOUT = float(os.getenv("MCP_HEALTHCHECK_TIMEOUT", "5"))
+    MCP_INPROCESS_LOCAL_TOOLS = os.getenv("MCP_INPROCESS_LOCAL_TOOLS", "true").lower() == "true" # csv/chart without stdio
 
 settings = Settings()
 
@@ -0,0 +1,139 @@
+import re
+import threading
+
+from config import settings
+from instrumentation import annotate
+
+ROW_FIELDS = ["state", "date", "crop_type", "planted_area", "production"]
+CITATION_FIELDS = ["dataset_name", "source", "source_url", "data_year"]
+TABLE_HEADER = "state | year | crop_type | planted_area_ha | production_tonnes"
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+_encoding = None
+_encoding_lock = threading.Lock()
+_stats = {} # node -> accumulated counters
+
+
+def load_tokenizer():
+    """tiktoken encoding of the chat model; False when it cannot be loaded (offline), counts are estimated then.
+    Loaded at startup (main.initialize) so the first request does not pay for the download"""
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+
+                    _encoding = tiktoken.get_encoding(settings.CONTEXT_TOKENIZER)
+                except Exception as e:
+                    print(f"Tokenizer {settings.CONTEXT_TOKENIZER} unavailable ({type(e).__name__}), estimating tokens from length")
+                    _encoding = False
+    return _encoding
+
+
+def count_tokens(text):
+    encoding = load_tokenizer()
+    if encoding:
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def _number(value):
+    value = float(value)
+    return f"{value:.0f}" if value.is_integer() else f"{value:.2f}".rstrip("0").rstrip(".")
+
+
+def _row(doc):
+    return " | ".join([
+        str(doc["state"]), str(doc["date"])[:4], str(doc["crop_type"]),
+        _number(doc["planted_area"]), _number(doc["production"])
+    ])
+
+
+def _citation(doc):
+    return tuple((field, doc[field]) for field in CITATION_FIELDS if doc.get(field))
+
+
+def _near_duplicate(words, kept, threshold=0.8):
+    return any(len(words & other) / (len(words | other) or 1) >= threshold for other in kept)
+
+
+def _node_budget(node):
+    return settings.DOCS_CONTEXT_BUDGETS.get(node, settings.DOCS_CONTEXT_BUDGET)
+
+
+def docs_context(docs, node, budget=None):
+    """Retrieved docs as prompt text: one citation header per source, one compact table row per dataset row,
+    duplicate chunks (the splitter overlap gives 1-2 chunks per row) dropped, most relevant rows first
+    until the node's token budget is spent"""
+    if not docs:
+        return None
+    budget = budget or _node_budget(node)
+
+    groups = {} # citation -> {"rows": [...], "passages": [...]}
+    seen_rows = set()
+    seen_passages = []
+    duplicates = 0
+    for doc in docs:
+        group = groups.setdefault(_citation(doc), {"rows": [], "passages": []})
+        if all(doc.get(field) is not None for field in ROW_FIELDS):
+            row = _row(doc)
+            if row in seen_rows:
+                duplicates += 1
+                continue
+            seen_rows.add(row)
+            group["rows"].append(row)
+        else:
+            # chunks without the structured fields are kept as text, near-duplicates dropped
+            words = set(_WORD.findall(str(doc.get("text", "")).lower()))
+            if not words or _near_duplicate(words, seen_passages):
+                duplicates += 1
+                continue
+            seen_passages.append(words)
+            group["passages"].append(" ".join(str(doc["text"]).split()))
+
+    lines = []
+    tokens = 0
+    kept = truncated = 0
+    for citation, group in groups.items():
+        header = [f"Source: {'; '.join(f'{field}={value}' for field, value in citation)}"] if citation else []
+        if group["rows"]:
+            header.append(TABLE_HEADER)
+        header_tokens = count_tokens("\n".join(header)) + 1
+        body = group["rows"] + group["passages"]
+        if tokens + header_tokens >= budget:
+            truncated += len(body)
+            continue
+
+        group_lines = []
+        group_tokens = header_tokens
+        for i, line in enumerate(body):
+            new_lines = [line]
+            if i == len(group["rows"]) and group["rows"]:
+                new_lines.insert(0, "Passages:") # text chunks under the table
+            line_tokens = count_tokens("\n".join(new_lines)) + 1
+            if tokens + group_tokens + line_tokens > budget:
+                truncated += len(body) - i
+                break
+            group_lines += new_lines
+            group_tokens += line_tokens
+            kept += 1
+        if group_lines:
+            lines += header + group_lines
+            tokens += group_tokens
+
+    if truncated:
+        lines.append(f"({truncated} more rows omitted, token budget {budget})")
+
+    stats = {"docs": len(docs), "kept": kept, "duplicates": duplicates, "truncated": truncated, "tokens": tokens}
+    total = _stats.setdefault(node, {"calls": 0, "docs": 0, "kept": 0, "duplicates": 0, "truncated": 0, "tokens": 0})
+    total["calls"] += 1
+    for key, value in stats.items():
+        total[key] += value
+    annotate(docs_context=stats) # lands in the node's metrics line
+    return "\n".join(lines)
+
+
+def docs_context_stats():
+    return {node: dict(counters) for node, counters in _stats.items()}
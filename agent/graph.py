@@ -1,22 +1,104 @@
-from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver # session memory
+from langchain_core.messages import HumanMessage
+from langgraph.graph import START, END
 from state import State
 from nodes import (guard_rail_messages, semantic_optimizer_filter, semantic_search, 
                   answer_generator, evaluation, hallucination_calculator, 
-                  guard_rail_answer, tavily_search_node, csv_generator, chart_generator)
+                  guard_rail_answer, tavily_search_node, csv_generator, chart_generator, analytics_query,
+                  answer_cache_lookup, answer_cache_store, speculative_input, post_checks_join,
+                  post_checks_background)
 from mcp_tools.mcp_client import initialize_mcp
+from config import settings
+from instrumentation import InstrumentedStateGraph, new_trace_id
+from utils.checkpointer import BoundedMemorySaver, SqliteCheckpointSaver # session memory
+
+MAX_ITERATIONS = 2 # answer drafts per turn, a low confidence draft below this is retried
+
+# checks started once the answer has no pending tools
+POST_CHECK_NODES = {
+    # last draft: fan-out, joined in post_checks_join; a draft that may be retried is evaluated first (see below)
+    "parallel": ["evaluation", "hallucination_calculator", "guard_rail_answer"],
+    "background": ["evaluation"], # hallucination + guard rail run after the answer is released
+    "sequential": ["evaluation"], # evaluation -> hallucination_calculator -> guard_rail_answer
+}
+
+
+
+def create_checkpointer():
+    """Session memory: in-process (one worker) or a SQLite file any worker process can resume a thread from;
+    both evict idle sessions and keep only the latest checkpoints of each"""
+    if settings.CHECKPOINT_BACKEND == "sqlite":
+        return SqliteCheckpointSaver(
+            settings.CHECKPOINT_PATH,
+            ttl=settings.CHECKPOINT_THREAD_TTL,
+            max_checkpoints=settings.CHECKPOINT_MAX_PER_THREAD
+        )
+    return BoundedMemorySaver(
+        max_threads=settings.CHECKPOINT_MAX_THREADS,
+        ttl=settings.CHECKPOINT_THREAD_TTL,
+        max_checkpoints=settings.CHECKPOINT_MAX_PER_THREAD
+    )
+
+
+def build_initial_state(message: str) -> dict:
+    """Fresh per-turn state; messages and history snapshots accumulate in the checkpointer"""
+    return {
+        "messages": [HumanMessage(content=message)],
+        "trace_id": new_trace_id(),
+        "answer": "",
+        "past_context": [],
+        "optimized_query": None,
+        "query_filter": None,
+        "retrieved_docs": [],
+        "evaluation_feedback": "",
+        "confidence_score": 0.0,
+        "iteration_count": 0,
+        "online_search_required": False,
+        "tavily_results": None,
+        "csv_export_required": False,
+        "csv_export_results": None,
+        "chart_image_required": False,
+        "chart_image_results": None,
+        "analytics_query_required": False,
+        "analytics_results": None,
+        "safety_flag_messages": False,
+        "safety_flag_answer": False,
+        "answer_cacheable": False,
+        "answer_cache_hit": False,
+        "hallucination_score": None,
+        "post_checks_pending": False
+    }
 
     
 def route_after_guard_rail_messages(state: State) -> str:
     """Route after guard rail messages check"""
     if state.get('safety_flag_messages', False):
         return "end"  # End if safety flag is True (violating guidelines)
+    return "answer_cache_lookup"
+
+
+def route_after_answer_cache_lookup(state: State) -> str:
+    """Route after answer cache lookup, a hit already carries the answer and its hallucination score"""
+    if state.get('answer_cache_hit', False):
+        return "end"
     return "semantic_optimizer_filter"
 
 
+def route_after_speculative_input(state: State) -> str:
+    """Route after the speculative guard rail / cache / retrieval join"""
+    if state.get('safety_flag_messages', False):
+        return "end"
+    if state.get('answer_cache_hit', False):
+        return "end"
+    return "answer_generator"
+
+
 def route_after_answer_generator(state: State) -> str:
     """Route after answer_generator based on tool requirements"""
     
+    # If exact numbers are required, query the crop table first
+    if state.get('analytics_query_required', False):
+        return "analytics_query"
+    
     # If csv export is required, go to csv generator
     if state.get('csv_export_required', False):
         return "csv_generator"
@@ -29,29 +111,45 @@ def route_after_answer_generator(state: State) -> str:
     if state.get('online_search_required', False):
         return "tavily_search"
     
-    # If no tools required, go to evaluation
-    return "evaluation"
+    # If no tools required, run the post-answer checks
+    if settings.POST_CHECKS_MODE == "parallel" and _retry_possible(state):
+        return "evaluation" # no hallucination / guard rail calls on a draft that may be thrown away
+    return POST_CHECK_NODES[settings.POST_CHECKS_MODE]
+
+
+def _retry_possible(state: State) -> bool:
+    return state.get('iteration_count', 0) < MAX_ITERATIONS
 
 
 def route_after_evaluation(state: State) -> str:
     """Route after evaluation based on confidence and iteration count"""
     
-    # If confidence < 0.6 and iteration < 2, retry with feedback
-    if state.get('confidence_score', 0) < 0.6 and state.get('iteration_count', 0) < 2:
+    # If confidence < EVALUATION_MIN_CONFIDENCE (0.6) and iteration < 2, retry with feedback
+    if state.get('confidence_score', 0) < settings.EVALUATION_MIN_CONFIDENCE and _retry_possible(state):
         return "answer_generator"
     
-    # Otherwise go to hallucination calculator
-    return "hallucination_calculator"
+    # Otherwise continue with the remaining post-answer checks (or finish, when they already ran)
+    return "post_checks"
+
+
+def route_after_evaluation_parallel(state: State):
+    """Parallel mode: retry, or start the remaining checks on a kept draft; on the last draft they already
+    run beside the evaluation"""
+    if route_after_evaluation(state) == "answer_generator":
+        return "answer_generator"
+    if _retry_possible(state):
+        return ["hallucination_calculator", "guard_rail_answer"]
+    return "end"
 
 
 def route_after_tool_usage(state: State) -> str:
-    """Route after tool usage (csv_generator, chart_generator, tavily_search)"""
+    """Route after tool usage (csv_generator, chart_generator, tavily_search, analytics_query)"""
     return "answer_generator"
 
 
 def route_after_guard_rail_answer(state: State) -> str:
     """Route after final guard rail answer check"""
-    return "end"
+    return "answer_cache_store"
 
 
 
@@ -64,46 +162,88 @@ async def create_graph():
     except Exception as e:
         print(f"MCP init failed: {e}")
         
-    graph = StateGraph(State)
+    graph = InstrumentedStateGraph(State) # every node is timed and charged for its llm usage
     
     # Add nodes
-    graph.add_node("guard_rail_messages", guard_rail_messages)
-    graph.add_node("semantic_optimizer_filter", semantic_optimizer_filter)
-    graph.add_node("semantic_search", semantic_search)
     graph.add_node("answer_generator", answer_generator)
     graph.add_node("evaluation", evaluation)
-    graph.add_node("hallucination_calculator", hallucination_calculator)
-    graph.add_node("guard_rail_answer", guard_rail_answer)
     graph.add_node("tavily_search", tavily_search_node)
     graph.add_node("csv_generator", csv_generator)
     graph.add_node("chart_generator", chart_generator)
+    graph.add_node("analytics_query", analytics_query)
     
-    
-    # Set entry point
-    graph.set_entry_point("guard_rail_messages")
-    
-    # Main flow: guard_rail_messages -> semantic_optimizer_filter -> semantic_search -> answer_generator -> evaluation
-    graph.add_conditional_edges("guard_rail_messages", route_after_guard_rail_messages, {
-        "semantic_optimizer_filter": "semantic_optimizer_filter",
-        "end": END
-    })
-    
-    graph.add_edge("semantic_optimizer_filter", "semantic_search")
-    graph.add_edge("semantic_search", "answer_generator")
+    if settings.SPECULATIVE_INPUT_ENABLED:
+        # Speculative flow: (guard_rail_messages | answer_cache_lookup | semantic_optimizer_filter -> semantic_search) -> answer_generator
+        graph.add_node("speculative_input", speculative_input)
+        graph.set_entry_point("speculative_input")
+        graph.add_conditional_edges("speculative_input", route_after_speculative_input, {
+            "answer_generator": "answer_generator",
+            "end": END
+        })
+    else:
+        # Sequential flow: guard_rail_messages -> answer_cache_lookup -> semantic_optimizer_filter -> semantic_search -> answer_generator
+        graph.add_node("guard_rail_messages", guard_rail_messages)
+        graph.add_node("answer_cache_lookup", answer_cache_lookup)
+        graph.add_node("semantic_optimizer_filter", semantic_optimizer_filter)
+        graph.add_node("semantic_search", semantic_search)
+        graph.set_entry_point("guard_rail_messages")
+        graph.add_conditional_edges("guard_rail_messages", route_after_guard_rail_messages, {
+            "answer_cache_lookup": "answer_cache_lookup",
+            "end": END
+        })
+        graph.add_conditional_edges("answer_cache_lookup", route_after_answer_cache_lookup, {
+            "semantic_optimizer_filter": "semantic_optimizer_filter",
+            "end": END
+        })
+        graph.add_edge("semantic_optimizer_filter", "semantic_search")
+        graph.add_edge("semantic_search", "answer_generator")
     
     # Conditional routing after answer_generator - tools go directly from answer_generator
     graph.add_conditional_edges("answer_generator", route_after_answer_generator, {
         "csv_generator": "csv_generator",
         "chart_generator": "chart_generator", 
         "tavily_search": "tavily_search",
-        "evaluation": "evaluation"
+        "analytics_query": "analytics_query",
+        **{node: node for node in POST_CHECK_NODES[settings.POST_CHECKS_MODE]}
     })
     
-    # Conditional routing after evaluation
-    graph.add_conditional_edges("evaluation", route_after_evaluation, {
-        "answer_generator": "answer_generator",  # retry path
-        "hallucination_calculator": "hallucination_calculator"
-    })
+    if settings.POST_CHECKS_MODE == "parallel":
+        # a draft that may be retried is evaluated first, the last draft runs all three checks concurrently
+        graph.add_node("hallucination_calculator", hallucination_calculator)
+        graph.add_node("guard_rail_answer", guard_rail_answer)
+        graph.add_node("post_checks_join", post_checks_join)
+        graph.add_node("answer_cache_store", answer_cache_store)
+        graph.add_conditional_edges("evaluation", route_after_evaluation_parallel, {
+            "answer_generator": "answer_generator",  # retry path
+            "hallucination_calculator": "hallucination_calculator",
+            "guard_rail_answer": "guard_rail_answer",
+            "end": END  # last draft, the other checks run alongside and join below
+        })
+        graph.add_edge(["hallucination_calculator", "guard_rail_answer"], "post_checks_join")
+        graph.add_edge("post_checks_join", "answer_cache_store")
+        graph.add_edge("answer_cache_store", END)
+    elif settings.POST_CHECKS_MODE == "background":
+        # the answer is released after evaluation, the remaining checks are logged by a background task
+        graph.add_node("post_checks_background", post_checks_background)
+        graph.add_conditional_edges("evaluation", route_after_evaluation, {
+            "answer_generator": "answer_generator",  # retry path
+            "post_checks": "post_checks_background"
+        })
+        graph.add_edge("post_checks_background", END)
+    else:
+        # Final flow: evaluation -> hallucination_calculator -> guard_rail_answer -> answer_cache_store -> end
+        graph.add_node("hallucination_calculator", hallucination_calculator)
+        graph.add_node("guard_rail_answer", guard_rail_answer)
+        graph.add_node("answer_cache_store", answer_cache_store)
+        graph.add_conditional_edges("evaluation", route_after_evaluation, {
+            "answer_generator": "answer_generator",  # retry path
+            "post_checks": "hallucination_calculator"
+        })
+        graph.add_edge("hallucination_calculator", "guard_rail_answer")
+        graph.add_conditional_edges("guard_rail_answer", route_after_guard_rail_answer, {
+            "answer_cache_store": "answer_cache_store"
+        })
+        graph.add_edge("answer_cache_store", END)
     
     # Tool usage paths - after using tools, go back to answer_generator
     graph.add_conditional_edges("tavily_search", route_after_tool_usage, {
@@ -115,14 +255,9 @@ async def create_graph():
     graph.add_conditional_edges("chart_generator", route_after_tool_usage, {
         "answer_generator": "answer_generator"
     })
-    
-    # evaluation routes directly to hallucination_calculator via conditional edges
-    
-    # Final flow: hallucination_calculator -> guard_rail_answer -> end
-    graph.add_edge("hallucination_calculator", "guard_rail_answer")
-    graph.add_conditional_edges("guard_rail_answer", route_after_guard_rail_answer, {
-        "end": END
+    graph.add_conditional_edges("analytics_query", route_after_tool_usage, {
+        "answer_generator": "answer_generator"
     })
     
-    memory = MemorySaver() # session memory checkpointer
+    memory = create_checkpointer() # session memory checkpointer
     return graph.compile(checkpointer=memory)
\ No newline at end of file
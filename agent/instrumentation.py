@@ -0,0 +1,263 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from functools import wraps
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langgraph.graph import StateGraph
+from config import settings
+
+# record of the node running in this task; tasks created inside a node inherit it
+_current = contextvars.ContextVar("node_record", default=None)
+
+COUNTERS = ["llm_calls", "prompt_tokens", "completion_tokens", "cost_usd", "cache_hits", "llm_errors"]
+
+
+def new_trace_id():
+    return uuid.uuid4().hex
+
+
+def _quantile(ordered, q):
+    # nearest rank over the sorted reservoir
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+class NodeMetrics:
+    """Per-node and per-request aggregates (latency reservoirs for p50/p95/p99, token/cost counters),
+    exported as Prometheus text and as one JSONL line per node run and per request"""
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, path=settings.METRICS_JSONL_PATH, reservoir=settings.METRICS_RESERVOIR):
+        self.path = path
+        self._latency = defaultdict(lambda: deque(maxlen=reservoir)) # node -> recent wall times (seconds)
+        self._totals = defaultdict(lambda: defaultdict(float)) # node -> counters
+        self._requests = deque(maxlen=reservoir)
+        self._request_totals = defaultdict(float)
+        self._traces = OrderedDict() # trace_id -> node runs + counters, released when the request finishes
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _write(self, record):
+        if not self.path:
+            return
+        try:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"Metrics write failed: {e}")
+
+    def _trace(self, trace_id):
+        trace = self._traces.get(trace_id)
+        if trace is None:
+            trace = self._traces[trace_id] = {"node_runs": {}, **{counter: 0 for counter in COUNTERS}}
+            while len(self._traces) > 1000: # requests that never finished
+                self._traces.popitem(last=False)
+        return trace
+
+    def attempt(self, trace_id, node):
+        with self._lock:
+            runs = self._trace(trace_id)["node_runs"]
+            runs[node] = runs.get(node, 0) + 1
+            return runs[node]
+
+    def observe(self, record):
+        with self._lock:
+            self._latency[record["node"]].append(record["wall_ms"] / 1000)
+            totals = self._totals[record["node"]]
+            totals["runs"] += 1
+            totals["retries"] += record["attempt"] > 1
+            totals["errors"] += "error" in record
+            totals["wall_seconds"] += record["wall_ms"] / 1000
+            trace = self._trace(record["trace_id"])
+            for counter in COUNTERS:
+                totals[counter] += record[counter]
+                trace[counter] += record[counter]
+            self._write({"type": "node", **record})
+
+    def finish_request(self, trace_id, wall_seconds, **fields):
+        """Close a request: request-level latency, one JSONL summary line, per-trace state released;
+        returns the request's node runs and llm totals"""
+        with self._lock:
+            trace = self._traces.pop(trace_id, None) or {"node_runs": {}}
+            trace["cost_usd"] = round(trace.get("cost_usd", 0), 8)
+            self._requests.append(wall_seconds)
+            self._request_totals["requests"] += 1
+            self._request_totals["wall_seconds"] += wall_seconds
+            self._write({
+                "type": "request", "trace_id": trace_id, "timestamp": time.time(),
+                "wall_ms": round(wall_seconds * 1000, 1), **trace, **fields
+            })
+            if self._file is not None:
+                self._file.flush()
+            return trace
+
+    def summary(self):
+        """node -> p50/p95/p99 latency (ms) and counters"""
+        with self._lock:
+            result = {}
+            for node, values in self._latency.items():
+                ordered = sorted(values)
+                result[node] = {
+                    **{f"p{int(q * 100)}_ms": round(_quantile(ordered, q) * 1000, 1) for q in self.QUANTILES},
+                    **{key: round(value, 6) for key, value in self._totals[node].items()},
+                }
+            return result
+
+    def prometheus(self):
+        """Prometheus text exposition: latency summaries (quantiles over the recent reservoir) and counters"""
+        lines = []
+        with self._lock:
+            lines += [
+                "# HELP rag_node_latency_seconds Wall time of a graph node run",
+                "# TYPE rag_node_latency_seconds summary",
+            ]
+            for node, values in self._latency.items():
+                ordered = sorted(values)
+                for q in self.QUANTILES:
+                    lines.append(f'rag_node_latency_seconds{{node="{node}",quantile="{q}"}} {_quantile(ordered, q):.6f}')
+                lines.append(f'rag_node_latency_seconds_sum{{node="{node}"}} {self._totals[node]["wall_seconds"]:.6f}')
+                lines.append(f'rag_node_latency_seconds_count{{node="{node}"}} {int(self._totals[node]["runs"])}')
+
+            for counter in ["runs", "retries", "errors", *COUNTERS]:
+                metric = f"rag_node_{counter}_total"
+                lines += [f"# TYPE {metric} counter"]
+                for node, totals in self._totals.items():
+                    lines.append(f'{metric}{{node="{node}"}} {totals[counter]:g}')
+
+            lines += [
+                "# HELP rag_request_latency_seconds Wall time of a whole chat request",
+                "# TYPE rag_request_latency_seconds summary",
+            ]
+            ordered = sorted(self._requests)
+            for q in self.QUANTILES if ordered else ():
+                lines.append(f'rag_request_latency_seconds{{quantile="{q}"}} {_quantile(ordered, q):.6f}')
+            lines.append(f"rag_request_latency_seconds_sum {self._request_totals['wall_seconds']:.6f}")
+            lines.append(f"rag_request_latency_seconds_count {int(self._request_totals['requests'])}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Forget the aggregates (e.g. after a warm-up run), the JSONL file is kept"""
+        with self._lock:
+            self._latency.clear()
+            self._totals.clear()
+            self._requests.clear()
+            self._request_totals.clear()
+            self._traces.clear()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+node_metrics = NodeMetrics()
+
+
+class UsageCallbackHandler(AsyncCallbackHandler):
+    """Charges every chat model call to the node record of the running task: calls, tokens, cost, cache hits"""
+
+    def __init__(self):
+        self._streamed = set() # run ids that produced tokens (a cached result never streams)
+
+    async def on_llm_new_token(self, token, *, run_id, **kwargs):
+        self._streamed.add(run_id)
+
+    async def on_llm_end(self, response, *, run_id, **kwargs):
+        streamed = run_id in self._streamed
+        self._streamed.discard(run_id)
+        record = _current.get()
+        if record is None:
+            return
+        record["llm_calls"] += 1
+        # a cache hit returns the stored generations without the provider's llm_output
+        if response.llm_output is None and not streamed:
+            record["cache_hits"] += 1
+            return
+
+        prompt_tokens = completion_tokens = 0
+        for generation in response.generations[0] if response.generations else []:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            prompt_tokens += usage.get("input_tokens", 0)
+            completion_tokens += usage.get("output_tokens", 0)
+        if not prompt_tokens and response.llm_output:
+            usage = response.llm_output.get("token_usage") or {}
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+
+        record["prompt_tokens"] += prompt_tokens
+        record["completion_tokens"] += completion_tokens
+        record["cost_usd"] += (
+            prompt_tokens * settings.LLM_PRICE_INPUT_PER_MTOK + completion_tokens * settings.LLM_PRICE_OUTPUT_PER_MTOK
+        ) / 1_000_000
+
+    async def on_llm_error(self, error, *, run_id, **kwargs):
+        self._streamed.discard(run_id)
+        record = _current.get()
+        if record is not None:
+            record["llm_errors"] += 1
+
+
+usage_callback = UsageCallbackHandler()
+
+
+def annotate(**fields):
+    """Attach fields to the metrics record of the node running in this task (no-op outside a node)"""
+    record = _current.get()
+    if record is not None:
+        record.update(fields)
+
+
+@contextmanager
+def track(node, trace_id):
+    """Measure one node run (or background work started by one) under the request's trace id"""
+    record = {
+        "trace_id": trace_id, "node": node, "timestamp": time.time(),
+        "attempt": node_metrics.attempt(trace_id, node), **{counter: 0 for counter in COUNTERS},
+    }
+    token = _current.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record["wall_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        record["cost_usd"] = round(record["cost_usd"], 8)
+        _current.reset(token)
+        node_metrics.observe(record)
+
+
+def instrument(name, node):
+    @wraps(node)
+    async def run(state):
+        with track(name, state.get("trace_id")) as record:
+            update = await node(state)
+            docs = (update or {}).get("retrieved_docs")
+            if docs:
+                scores = [doc["score"] for doc in docs if doc.get("score") is not None]
+                record["retrieval"] = {
+                    "docs": len(docs),
+                    "top_score": max(scores, default=None),
+                    "mean_score": sum(scores) / len(scores) if scores else None,
+                }
+            return update
+    return run
+
+
+class InstrumentedStateGraph(StateGraph):
+    """StateGraph whose nodes are timed and charged for their llm usage as they are registered"""
+
+    def add_node(self, node, action=None, **kwargs):
+        if isinstance(node, str) and action is not None:
+            action = instrument(node, action)
+        return super().add_node(node, action, **kwargs)
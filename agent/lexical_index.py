@@ -0,0 +1,124 @@
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+from config import settings
+from query_filter import candidate_mask, filter_columns, parse_query_filter
+from vector_store import OUTPUT_FIELDS
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lowercase alphanumeric tokens, plural 's' stripped so 'crops' matches 'crop'"""
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(str(text).lower()):
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def expand_query(query):
+    """Append the canonical dataset spellings of aliases ('penang' -> 'Pulau Pinang', 'rice' -> 'paddy')"""
+    query_filter = parse_query_filter(query)
+    if not query_filter:
+        return query
+    return " ".join([query, *query_filter["states"], *query_filter["crop_types"]])
+
+
+class BM25Index:
+    """Okapi BM25 inverted index over the chunk text, postings held as numpy arrays"""
+
+    def __init__(self, docs, k1=1.5, b=0.75):
+        self.docs = [{field: doc[field] for field in OUTPUT_FIELDS} for doc in docs]
+        self.k1 = k1
+        self.b = b
+
+        term_docs = defaultdict(list)
+        term_freqs = defaultdict(list)
+        lengths = np.zeros(len(self.docs), dtype=np.float32)
+        for i, doc in enumerate(self.docs):
+            tokens = tokenize(doc["text"])
+            lengths[i] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                term_docs[term].append(i)
+                term_freqs[term].append(tf)
+
+        self.postings = {
+            term: (np.array(term_docs[term], dtype=np.int32), np.array(term_freqs[term], dtype=np.float32))
+            for term in term_docs
+        }
+        n = len(self.docs)
+        self.idf = {
+            term: math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5)) for term, (ids, _) in self.postings.items()
+        }
+        # length normalisation per document, computed once
+        self.norm = k1 * (1 - b + b * lengths / (lengths.mean() or 1.0))
+        self.columns = filter_columns(self.docs)
+
+    def search(self, query, k, query_filter=None):
+        """Top-k chunks by BM25 score, same hit shape as the vector stores"""
+        scores = np.zeros(len(self.docs), dtype=np.float32)
+        for term in set(tokenize(expand_query(query))):
+            if term not in self.postings:
+                continue
+            ids, tfs = self.postings[term]
+            scores[ids] += self.idf[term] * tfs * (self.k1 + 1) / (tfs + self.norm[ids])
+
+        if query_filter:
+            scores[~candidate_mask(self.columns, query_filter)] = 0
+
+        candidates = np.flatnonzero(scores > 0)
+        top = candidates[np.argsort(-scores[candidates])[:k]]
+        return [self.docs[i] | {"score": float(scores[i])} for i in top]
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "docs": self.docs}, f, ensure_ascii=False)
+        print(f"Lexical index written to {path}: {len(self.docs)} chunks, {len(self.postings)} terms")
+
+    @classmethod
+    def load(cls, path):
+        # postings are rebuilt from the stored chunks, a few ms for this corpus
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["docs"], k1=data["k1"], b=data["b"])
+
+
+def reciprocal_rank_fusion(ranked_lists, weights, k, rrf_k=settings.RRF_K):
+    """Merge ranked hit lists by weighted RRF: rrf_score = sum(weight / (rrf_k + rank)), hits keyed by chunk text.
+    A hit found in several lists keeps the fields of the earliest list (its "score" stays that list's score)"""
+    fused = {}
+    for hits, weight in zip(ranked_lists, weights):
+        for rank, hit in enumerate(hits, start=1):
+            entry = fused.setdefault(hit["text"], {"doc": {}, "rrf_score": 0.0})
+            entry["doc"] = hit | entry["doc"]
+            entry["rrf_score"] += weight / (rrf_k + rank)
+
+    ranked = sorted(fused.values(), key=lambda entry: entry["rrf_score"], reverse=True)[:k]
+    return [entry["doc"] | {"rrf_score": entry["rrf_score"]} for entry in ranked]
+
+
+def load_lexical_index(path=settings.LEXICAL_INDEX_PATH):
+    """Load the index written at ingestion time, or build it from the dataset CSV when missing"""
+    if os.path.exists(path):
+        return BM25Index.load(path)
+
+    from vector_store import chunk_dataset
+
+    print(f"Lexical index not found at {path}, building it from {settings.DATASET_CSV_PATH}")
+    index = BM25Index(chunk_dataset())
+    index.save(path)
+    return index
+
+
+if __name__ == "__main__":
+    # uv run agent/lexical_index.py  (Milvus deployments; the local store build writes it too)
+    from vector_store import chunk_dataset
+
+    BM25Index(chunk_dataset()).save(settings.LEXICAL_INDEX_PATH)
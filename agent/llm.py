@@ -1,10 +1,48 @@
+import os
+
 from langchain_openai import ChatOpenAI
 from config import settings
+from utils.llm_cache import CountingCache, LRUCache
+from utils.cassette import cassette
+from instrumentation import usage_callback
 
 llm = ChatOpenAI(
     model="gpt-4.1-mini",
     # model="gpt-5-nano", reasoning model
-    api_key=settings.OPENAI_API_KEY
-   
+    api_key=settings.OPENAI_API_KEY or ("replay" if cassette.replaying else ""), # replay never reaches the api
+    stream_usage=True, # token usage on streamed answers too
+    callbacks=[usage_callback], # per-node llm calls, tokens and cost
+    http_async_client=cassette.http_async_client() # records / replays requests when CASSETTE_MODE is set
 )
 
+
+def _create_cache_backend():
+    if settings.LLM_CACHE_BACKEND == "sqlite":
+        from langchain_community.cache import SQLiteCache
+
+        os.makedirs(os.path.dirname(settings.LLM_CACHE_PATH) or ".", exist_ok=True)
+        return SQLiteCache(database_path=settings.LLM_CACHE_PATH)
+    if settings.LLM_CACHE_BACKEND == "memory":
+        return LRUCache(max_items=settings.LLM_CACHE_SIZE)
+    return None
+
+
+_cache_backend = _create_cache_backend()
+_node_caches = {} # node name -> CountingCache
+_node_llms = {}
+
+
+def get_llm(node):
+    """The shared llm for a graph node, with the call cache (keyed on model, messages and schema)
+    when the node is listed in settings.LLM_CACHE_NODES"""
+    if _cache_backend is None or node not in settings.LLM_CACHE_NODES:
+        return llm
+    if node not in _node_llms:
+        _node_caches[node] = CountingCache(_cache_backend, node)
+        _node_llms[node] = llm.model_copy(update={"cache": _node_caches[node]})
+    return _node_llms[node]
+
+
+def llm_cache_stats():
+    """Hit rates per cached node"""
+    return {node: cache.stats() for node, cache in _node_caches.items()}
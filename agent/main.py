@@ -1,83 +1,166 @@
 # agent/main.py
 import asyncio
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager
+
 import gradio as gr
-from graph import create_graph
-from langchain_core.messages import HumanMessage
-from utils.logger import save_query_answer
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+_import_started = time.perf_counter()
+from graph import create_graph, build_initial_state
+_graph_import_seconds = time.perf_counter() - _import_started
+
+from utils.logger import save_query_answer, event_log
+from utils.cassette import cassette
+from retriever import warm_up, close_retriever
+from nodes import answer_cache
+from mcp_tools.mcp_client import close_mcp
+from llm import llm_cache_stats
+from streaming import stream_answer
+from instrumentation import node_metrics
+from context_builder import load_tokenizer
+from config import settings
 
 graph = None
 
+
+def check_import_budget():
+    """Warn when importing the graph is slow or pulls in heavy modules before the UI is up"""
+    heavy = [name for name in ("torch", "sentence_transformers", "pymilvus") if name in sys.modules]
+    if heavy:
+        print(f"Warning: heavy modules loaded at import time: {', '.join(heavy)}")
+    if _graph_import_seconds > settings.IMPORT_TIME_BUDGET:
+        print(f"Warning: graph import took {_graph_import_seconds:.2f}s (budget {settings.IMPORT_TIME_BUDGET}s)")
+
+
 async def initialize():
     global graph
     print("Initializing system.....")
+    check_import_budget()
     
     graph = await create_graph()
+    await asyncio.to_thread(load_tokenizer) # off the first request, the download can block for a while
+    
+    # load the embedding model in the background, guard rail path is served meanwhile
+    if settings.WARM_UP_ON_START:
+        threading.Thread(target=warm_up, name="retriever-warm-up", daemon=True).start()
     print("System ready to rock and roll")
 
-async def chat(message: str, history: list) -> str:
+
+async def shutdown():
+    """Release the MCP sessions, the vector store client and the caches on the loop that opened them"""
+    print("Shutting down.....")
+    await close_mcp()
+    if graph is not None and hasattr(graph.checkpointer, "aclose"):
+        await graph.checkpointer.aclose()
+    close_retriever()
+    answer_cache.close()
+    node_metrics.close()
+    event_log.close() # drains the queued log records
+    cassette.close()
+
+def final_answer(message: str, result: dict, latency: float, request_metrics: dict) -> str:
+    """Apply the guard rail flags to the final state and log the turn with its latency and node metrics"""
     
-    thread_id = "gradio_session_001"
+    # Check for safety flags from guard rail messages
+    safety_flag_messages = result.get("safety_flag_messages", False)
+    safety_flag_answer = result.get("safety_flag_answer", False)
     
+    if safety_flag_messages:
+        return "Your query contains inappropriate content. Please ask agriculture-related questions only."
+    
+    if safety_flag_answer:
+        return "I cannot provide this information as it may contain inappropriate content. Please ask agriculture-related questions only."
+    
+    
+    user_message = message
+    answer = result["answer"]
+    hallucination= result.get("hallucination_score")
+    
+    # Create a minimal state with only the required fields
+    minimal_state = {
+        "hallucination_score": hallucination
+    }
+    
+    # Save to JSONL file using the logger (question/answer only, no state)
+    # background post checks log their own record once the scores are in
+    if not result.get("post_checks_pending", False):
+        save_query_answer(
+            user_message, answer, minimal_state,
+            trace_id=result.get("trace_id"),
+            latency_ms=round(latency * 1000, 1),
+            answer_cache_hit=result.get("answer_cache_hit", False),
+            iterations=result.get("iteration_count", 0),
+            nodes=request_metrics
+        )
+    print(f"LLM cache: {llm_cache_stats()}")
+    print(f"Checkpointer: {graph.checkpointer.stats()}")
+    
+    return result["answer"]
+
+
+def session_config(request: gr.Request | None) -> dict:
+    """One checkpointer thread per browser session, so conversations never mix"""
+    session = request.session_hash if request is not None and request.session_hash else "default"
+    return {"configurable": {"thread_id": f"gradio_{session}"}}
+
+
+async def chat(message: str, history: list, request: gr.Request) -> str:
+    
+    started = time.perf_counter()
+    initial_state = build_initial_state(message)
+    finished = False # the request's trace is closed exactly once
     try:
-        # Initialize state with proper defaults
-        initial_state = {
-            "messages": [HumanMessage(content=message)],
-            "answer": "",
-            "past_context": [],
-            "optimized_query": None,
-            "retrieved_docs": [],
-            "evaluation_feedback": "",
-            "confidence_score": 0.0,
-            "iteration_count": 0,
-            "online_search_required": False,
-            "tavily_results": None,
-            "csv_export_required": False,
-            "csv_export_results": None,
-            "chart_image_required": False,
-            "chart_image_results": None,
-            "safety_flag_messages": False,
-            "safety_flag_answer": False,
-            "hallucination_score": None
-        }
-        
         result = await graph.ainvoke(
             initial_state,
-            config={"configurable": {"thread_id": thread_id}}
+            config=session_config(request)
         )
-        
-        # Check for safety flags from guard rail messages
-        safety_flag_messages = result.get("safety_flag_messages", False)
-        safety_flag_answer = result.get("safety_flag_answer", False)
-        
-        if safety_flag_messages:
-            return "Your query contains inappropriate content. Please ask agriculture-related questions only."
-        
-        if safety_flag_answer:
-            return "I cannot provide this information as it may contain inappropriate content. Please ask agriculture-related questions only."
-        
-        
-        user_message = message
-        answer = result["answer"]
-        hallucination= result.get("hallucination_score")
-        
-        # Create a minimal state with only the required fields
-        minimal_state = {
-            "hallucination_score": hallucination
-        }
-        
-        # Save to JSONL file using the logger (question/answer only, no state)
-        save_query_answer(user_message, answer, minimal_state)
-        
-        return result["answer"]
+        latency = time.perf_counter() - started
+        request_metrics = node_metrics.finish_request(initial_state["trace_id"], latency)
+        finished = True
+        return final_answer(message, result, latency, request_metrics)
     except Exception as e:
+        if not finished:
+            node_metrics.finish_request(initial_state["trace_id"], time.perf_counter() - started, error=str(e))
+            finished = True
         return f"Error: {str(e)}"
+    finally:
+        if not finished: # cancelled
+            node_metrics.finish_request(initial_state["trace_id"], time.perf_counter() - started, error="cancelled")
 
-def chat_sync(message: str, history: list) -> str:
-    """Sync wrapper for Gradio"""
-    return asyncio.run(chat(message, history))
+
+async def chat_stream(message: str, history: list, request: gr.Request):
+    """Streaming handler for Gradio: answer tokens as they arrive, progress for tool nodes, then the checked answer
+    (which replaces the streamed text, e.g. when the output guard rail flags it)"""
+    
+    config = session_config(request)
+    started = time.perf_counter()
+    initial_state = build_initial_state(message)
+    finished = False # the request's trace is closed exactly once
+    
+    try:
+        async for text in stream_answer(graph, initial_state, config):
+            yield text
+        result = (await graph.aget_state(config)).values
+        latency = time.perf_counter() - started
+        request_metrics = node_metrics.finish_request(initial_state["trace_id"], latency)
+        finished = True
+        yield final_answer(message, result, latency, request_metrics)
+    except Exception as e:
+        if not finished:
+            node_metrics.finish_request(initial_state["trace_id"], time.perf_counter() - started, error=str(e))
+            finished = True
+        yield f"Error: {str(e)}"
+    finally:
+        if not finished: # cancelled, or the client left mid-stream (GeneratorExit)
+            node_metrics.finish_request(initial_state["trace_id"], time.perf_counter() - started, error="cancelled")
 
 demo = gr.ChatInterface(
-    fn=chat_sync,
+    fn=chat_stream if settings.STREAMING_ENABLED else chat,
     title="RAG Chatbot - Malaysia Crop Data (https://open.dosm.gov.my/)",
     description="Ask questions about aggriculture topic and dataset (crop production, planted area, and statistics by state [2017-2022])" ,
     examples=[
@@ -105,11 +188,27 @@ demo = gr.ChatInterface(
     ],
     theme=gr.themes.Soft()
 )
+# bounded concurrency, extra requests wait in the queue instead of piling up on the llm
+demo.queue(default_concurrency_limit=settings.CHAT_CONCURRENCY_LIMIT, max_size=settings.CHAT_QUEUE_SIZE)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # graph, MCP sessions and background tasks all live on the server's event loop
+    await initialize()
+    yield
+    await shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> str:
+    """Per-node latency quantiles, llm calls, tokens and cost in Prometheus text format"""
+    return node_metrics.prometheus()
+
+# registered before the UI mount, which catches every other path
+app = gr.mount_gradio_app(app, demo, path="/")
 
 if __name__ == "__main__":
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(initialize())
-    loop.close()
-    
-    demo.launch(server_name="127.0.0.1", server_port=7860)
\ No newline at end of file
+    uvicorn.run(app, host=settings.SERVER_HOST, port=settings.SERVER_PORT)
\ No newline at end of file
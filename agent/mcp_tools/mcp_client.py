@@ -1,74 +1,228 @@
 from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import load_mcp_tools
+from mcp_tools.tool_registry import load_inprocess_tools
+from utils.cassette import cassette
 from config import Settings
+import asyncio
+import time
 import os
 
 
+# MCP server names
+TAVILY_SERVER = "tavily-remote-mcp"
+CSV_SERVER = "csv-gen"
+CHART_SERVER = "chart-generator"
+
+# local FastMCP servers that can be bound in-process instead of over stdio
+LOCAL_SERVERS = {
+    CSV_SERVER: "mcp_tools.csv_gen_server",
+    CHART_SERVER: "mcp_tools.chart_server",
+}
 
 # Global MCP client
 mcp_client = None
-_tools_cache = None
+_sessions = {} # server name -> MCPServerSession (long-lived, started lazily)
+_locks = {} # server name -> (event loop, asyncio.Lock)
+
+
+class MCPServerSession:
+    """Long-lived stdio session for one MCP server, started once and reused across tool calls"""
+
+    def __init__(self, server_name):
+        self.server_name = server_name
+        self.session = None
+        self.tools = [] # tools cache, bound to the open session
+        self.restarts = 0
+        self._task = None
+        self._stop = None
+        self._loop = None
+        self._last_health_check = 0.0
+
+    async def start(self):
+        """Spawn the server process and keep its session open in a background task"""
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        started = self._loop.create_future()
+        self._task = asyncio.create_task(self._run(started), name=f"mcp-session-{self.server_name}")
+
+        try:
+            await asyncio.wait_for(asyncio.shield(started), timeout=Settings.MCP_STARTUP_TIMEOUT)
+        except BaseException:
+            self._task.cancel()
+            raise
+
+        self._last_health_check = time.monotonic()
+        print(f"MCP server '{self.server_name}' started, {len(self.tools)} tools loaded")
+
+    async def _run(self, started):
+        # session context must be entered and exited in the same task (anyio cancel scopes)
+        try:
+            async with mcp_client.session(self.server_name) as session:
+                self.session = session
+                self.tools = await load_mcp_tools(session)
+                started.set_result(None)
+                await self._stop.wait()
+        except Exception as e:
+            if not started.done():
+                started.set_exception(e)
+            else:
+                print(f"MCP server '{self.server_name}' session closed with error: {e}")
+        finally:
+            self.session = None
+            self.tools = []
+
+    async def is_healthy(self):
+        """Cheap liveness check, plus a ping at most every MCP_HEALTHCHECK_INTERVAL seconds"""
+        if self._task is None or self._task.done() or self.session is None:
+            return False
+
+        # sessions are tied to the loop they were opened on
+        if self._loop is not asyncio.get_running_loop():
+            return False
+
+        if time.monotonic() - self._last_health_check < Settings.MCP_HEALTHCHECK_INTERVAL:
+            return True
+
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout=Settings.MCP_HEALTHCHECK_TIMEOUT)
+        except Exception as e:
+            print(f"MCP server '{self.server_name}' health check failed: {e}")
+            return False
+
+        self._last_health_check = time.monotonic()
+        return True
+
+    async def stop(self):
+        """Close the session and terminate the server process"""
+        if self._task is None or self._task.done():
+            return
+
+        # a session opened on another (closed) loop cannot be shut down from here
+        if self._loop is not asyncio.get_running_loop():
+            return
+
+        self._stop.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=Settings.MCP_HEALTHCHECK_TIMEOUT)
+        except Exception:
+            self._task.cancel()
+
 
 async def initialize_mcp():
-    """Initialize MCP memory client"""
-    
+    """Initialize MCP client config, servers are started lazily on first use"""
+
     global mcp_client
-    
+
     if mcp_client is not None:
         return
-    
+
     os.makedirs(Settings.CSV_GEN_OUTPUT_DIR, exist_ok=True) # directory for csv files
-    
+
     # check csv server exists
     csv_server_path = "agent/mcp_tools/csv_gen_server.py"
     if not os.path.exists(csv_server_path):
         print(f"Warning: CSV server not found at {csv_server_path}")
         print("CSV generation will not be available")
         csv_server_path = None
-    
-    # Create MCP client
-    mcp_client = MultiServerMCPClient({
+
+    connections = {
         # "memory": {
         #     "command": "npx",
         #     "args": ["-y", "@modelcontextprotocol/server-memory"],
         #     "env": {"MEMORY_FILE_PATH": "./database/user-database/memory.jsonl"},
         #     "transport": "stdio"
         # }
-        "tavily-remote-mcp": {
+        TAVILY_SERVER: {
             "command": "npx",
             "args": ["-y", "mcp-remote", f"https://mcp.tavily.com/mcp/?tavilyApiKey={Settings.TAVILY_API_KEY}"],
             "env": {},
             "transport": "stdio"
         },
-        "csv-gen": {
+        CHART_SERVER: {
             "command": "uv",
-            "args": ["run", f"{csv_server_path}"],
+            "args": ["run", "agent/mcp_tools/chart_server.py"],
             "env": {},
             "transport": "stdio"
         },
-        "chart-generator": {
+    }
+    if csv_server_path:
+        connections[CSV_SERVER] = {
             "command": "uv",
-            "args": ["run", "agent/mcp_tools/chart_server.py"],
+            "args": ["run", f"{csv_server_path}"],
             "env": {},
             "transport": "stdio"
-        },
-    })
+        }
+
+    # Create MCP client (no process is spawned here)
+    mcp_client = MultiServerMCPClient(connections)
     print("MCP client initialized")
 
 
+def _get_lock(server_name):
+    loop = asyncio.get_running_loop()
+    entry = _locks.get(server_name)
+    if entry is None or entry[0] is not loop:
+        entry = (loop, asyncio.Lock())
+        _locks[server_name] = entry
+    return entry[1]
+
+
+async def get_session(server_name):
+    """Return a healthy pooled session for server_name, starting or restarting it if needed"""
+    async with _get_lock(server_name):
+        server = _sessions.get(server_name)
+
+        if server is not None and await server.is_healthy():
+            return server
+
+        restarts = 0
+        if server is not None:
+            print(f"Restarting MCP server '{server_name}'")
+            await server.stop()
+            restarts = server.restarts + 1
 
-async def get_tools():
-    """Get all tools from MCP"""
+        server = MCPServerSession(server_name)
+        server.restarts = restarts
+        await server.start()
+        _sessions[server_name] = server
+        return server
+
+
+async def get_tools(server_name=None):
+    """Get tools from one MCP server (or all servers when server_name is None)"""
+    if cassette.replaying:
+        return cassette.replay_tools(server_name) # recorded listing, no server is started
+    
     if mcp_client is None:
         print("MCP client not initialized")
         return [] # return empty list if tools loading failed to avoid errors
-    
-    try:
-        tools = await mcp_client.get_tools()
-        print(f" {len(tools)} tools loaded")
-        return tools
-    except Exception as e:
-        print(f"Tool loading failed: {e}")
-        print("Available tools will be limited")
-        return [] # return empty list if tools loading failed to avoid errors
-    
-    
\ No newline at end of file
+
+    server_names = [server_name] if server_name else list(mcp_client.connections)
+
+    tools = []
+    for name in server_names:
+        if name not in mcp_client.connections:
+            print(f"MCP server '{name}' not configured")
+            continue
+        try:
+            if Settings.MCP_INPROCESS_LOCAL_TOOLS and name in LOCAL_SERVERS:
+                server_tools = await load_inprocess_tools(LOCAL_SERVERS[name])
+            else:
+                server_tools = (await get_session(name)).tools
+            tools.extend(cassette.tools(name, server_tools) if cassette.recording else server_tools)
+        except Exception as e:
+            print(f"Tool loading failed for '{name}': {e}")
+            print("Available tools will be limited")
+
+    return tools # empty list if tools loading failed to avoid errors
+
+
+async def close_mcp():
+    """Stop all pooled MCP sessions"""
+    for server in list(_sessions.values()):
+        try:
+            await server.stop()
+        except Exception as e:
+            print(f"Error stopping MCP server '{server.server_name}': {e}")
+    _sessions.clear()
+
@@ -0,0 +1,45 @@
+from langchain_core.tools import StructuredTool, ToolException
+from mcp.types import TextContent
+import importlib
+
+
+# module name -> LangChain tools bound to the FastMCP server in that module
+_tools_cache = {}
+
+
+def _to_langchain_tool(server, tool):
+    """Wrap a FastMCP tool as a LangChain tool with the same name and schema the MCP adapter exposes"""
+
+    async def call_tool(**arguments):
+        try:
+            contents = await server.call_tool(tool.name, arguments)
+        except Exception as e:
+            raise ToolException(str(e))
+
+        # same conversion as the MCP adapter: single text -> str, several -> list
+        texts = [content.text for content in contents if isinstance(content, TextContent)]
+        if not texts:
+            return ""
+        return texts[0] if len(texts) == 1 else texts
+
+    return StructuredTool(
+        name=tool.name,
+        description=tool.description or "",
+        args_schema=tool.inputSchema,
+        coroutine=call_tool,
+        metadata={"transport": "in-process"},
+    )
+
+
+async def load_inprocess_tools(module_name):
+    """Import a local FastMCP server module and bind its tools in-process (no subprocess, no JSON-RPC)"""
+    if module_name in _tools_cache:
+        return _tools_cache[module_name]
+
+    module = importlib.import_module(module_name)
+    server = module.mcp
+    tools = [_to_langchain_tool(server, tool) for tool in await server.list_tools()]
+
+    _tools_cache[module_name] = tools
+    print(f"{len(tools)} in-process tools loaded from {module_name}")
+    return tools
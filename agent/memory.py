@@ -0,0 +1,106 @@
+import json
+import re
+
+from langchain_core.messages import HumanMessage, RemoveMessage, SystemMessage
+from config import settings
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def _clip(text, limit):
+    text = " ".join(str(text or "").split())
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+
+class ConversationMemory:
+    """Conversation memory shared by every node: the last `window` turns verbatim, older turns folded into a
+    compact digest, so the checkpoint and the prompt history stay the same size however long the session runs"""
+
+    def __init__(self, window=settings.MEMORY_WINDOW_TURNS, summary_mode=settings.MEMORY_SUMMARY_MODE,
+                 summary_max_chars=settings.MEMORY_SUMMARY_MAX_CHARS):
+        self.window = window
+        self.summary_mode = summary_mode # extractive | llm | none
+        self.summary_max_chars = summary_max_chars
+
+    @staticmethod
+    def turn_id(state):
+        # add_messages gives every message an id, retries and tool loops of a turn share it
+        return state["messages"][-1].id
+
+    def context(self, state):
+        """Past context for any prompt: digest of older turns + the recent turns of the window, or None"""
+        summary = state.get("history_summary")
+        turns = [
+            {key: value for key, value in snapshot.items() if key != "turn_id"}
+            for snapshot in state.get("history_snapshots", [])
+        ]
+        if not summary and not turns:
+            return None
+        data = {"recent_turns": turns}
+        if summary:
+            data = {"summary": summary} | data
+        return json.dumps(data, ensure_ascii=False)
+
+    def snapshot(self, state, answer, search_results=None, csv_output_results=None, chart_output_results=None):
+        return {
+            "turn_id": self.turn_id(state),
+            "user_message": state["messages"][-1].content,
+            "answer": answer,
+            "search_results_present": bool(search_results),
+            "csv_results_present": bool(csv_output_results),
+            "chart_results_present": bool(chart_output_results)
+        }
+
+    def _leaving(self, state):
+        """Turns pushed out of the window by the current turn (none on a retry of the same turn)"""
+        current = self.turn_id(state)
+        previous = [snapshot for snapshot in state.get("history_snapshots", []) if snapshot.get("turn_id") != current]
+        return previous[:max(0, len(previous) - (self.window - 1))]
+
+    def _extractive(self, summary, turns):
+        lines = summary.splitlines() if summary else []
+        for turn in turns:
+            answer = _SENTENCE_END.split(" ".join(str(turn.get("answer") or "").split()), maxsplit=1)[0]
+            lines.append(f"- {_clip(turn.get('user_message'), 120)} -> {_clip(answer, 200)}")
+        # oldest lines go first once the digest is full
+        while lines and sum(len(line) + 1 for line in lines) > self.summary_max_chars:
+            lines.pop(0)
+        return "\n".join(lines) or None
+
+    async def fold(self, state):
+        """Digest after this turn: older turns leaving the window are merged into it incrementally"""
+        summary = state.get("history_summary")
+        leaving = self._leaving(state)
+        if not leaving or self.summary_mode == "none":
+            return summary
+        if self.summary_mode == "llm":
+            from llm import get_llm
+            from prompts import memory_summary_prompt
+
+            turns = json.dumps(
+                [{"user_message": turn.get("user_message"), "answer": turn.get("answer")} for turn in leaving],
+                ensure_ascii=False
+            )
+            system_prompt, user_prompt = memory_summary_prompt(summary, turns, self.summary_max_chars)
+            try:
+                response = await get_llm("memory_summarizer").ainvoke(
+                    [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
+                )
+                return response.content.strip()[:self.summary_max_chars] or summary
+            except Exception as e:
+                print(f"Memory summary error, falling back to the extractive digest: {e}")
+        return self._extractive(summary, leaving)
+
+    def record(self, state, snapshot, summary):
+        """State update for the turn's snapshot: replaces the snapshot of the same turn, keeps the last `window`
+        turns and drops user messages older than the window from the checkpoint"""
+        turns = [item for item in state.get("history_snapshots", []) if item.get("turn_id") != snapshot["turn_id"]]
+        turns = (turns + [snapshot])[-self.window:]
+        stale = state["messages"][:-self.window]
+        update = {"history_snapshots": turns, "history_summary": summary}
+        if stale:
+            update["messages"] = [RemoveMessage(id=message.id) for message in stale]
+        return update
+
+
+conversation_memory = ConversationMemory()
@@ -2,13 +2,34 @@ from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from state import State
 from schema import (EvaluationSchema, ChartConfig, GuardRailSchemaMessages, 
                     GuardRailSchemaAnswer, AnswerGenerationSchema, HallucinationResult, TavilySearchSchema)
-from llm import llm
-from retriever import semantic_search_milvus
+from llm import llm, get_llm
+from analytics import crop_data_tool
+from retriever import asemantic_search, aembed_query, embedding_cache
+from query_filter import parse_query_filter
+from input_classifier import input_classifier, UNCERTAIN, DENY
+from memory import conversation_memory
+from streaming import ANSWER_TAG
+from instrumentation import track
+from config import settings
+from utils.answer_cache import AnswerCache, dataset_version
+from utils.logger import save_query_answer
 from prompts import (filter_prompt, answer_prompt, evaluation_prompt, tavily_search_prompt, csv_generator_prompt, 
-                    chart_generator_prompt,guard_rail_prompt_messages, guard_rail_prompt_answer, hallucination_prompt)
-from mcp_tools.mcp_client import get_tools # get_csv_gen_tools
+                    chart_generator_prompt,guard_rail_prompt_messages, guard_rail_prompt_answer, hallucination_prompt,
+                    analytics_query_prompt)
+from mcp_tools.mcp_client import get_tools, TAVILY_SERVER, CSV_SERVER, CHART_SERVER
+import asyncio
 import os
-import json
+
+ANSWER_ERROR = "Error generating answer" # answer of a failed generation, never cached
+
+# near-duplicate questions on the same dataset version are answered from here
+answer_cache = AnswerCache(
+    scope=f"{settings.DATASET_VERSION or dataset_version(settings.DATASET_CSV_PATH)}:{embedding_cache.model_name}",
+    path=settings.ANSWER_CACHE_PATH if settings.ANSWER_CACHE_ENABLED else None,
+    threshold=settings.ANSWER_CACHE_THRESHOLD,
+    ttl=settings.ANSWER_CACHE_TTL,
+    max_items=settings.ANSWER_CACHE_SIZE
+)
 
         
 
@@ -20,10 +41,23 @@ async def guard_rail_messages(state: State) -> dict:
     print("\n==== Guard Rail Messages Triggered ====\n")
     user_message = state["messages"][-1].content
     
+    # obvious cases are decided locally, only uncertain messages go to the llm
+    if settings.INPUT_CLASSIFIER_ENABLED:
+        try:
+            verdict = await input_classifier.aclassify(user_message)
+        except Exception as e:
+            print(f"Input classifier error, falling back to the llm guard rail: {e}")
+            verdict = UNCERTAIN
+        print(f"Input classifier: {verdict} {input_classifier.stats()}")
+        if verdict != UNCERTAIN:
+            return {
+                "safety_flag_messages": verdict == DENY
+            }
+    
     system_prompt, user_prompt = guard_rail_prompt_messages(user_message)
     messages = [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
     
-    llm_model = llm.with_structured_output(GuardRailSchemaMessages)
+    llm_model = get_llm("guard_rail_messages").with_structured_output(GuardRailSchemaMessages)
     
     try:
         result = await llm_model.ainvoke(messages)
@@ -41,6 +75,78 @@ async def guard_rail_messages(state: State) -> dict:
     }
     
     
+def _answer_cacheable(state: State) -> bool:
+    """Only standalone questions: first turn of the thread, or the question names its own state/year/crop"""
+    if not settings.ANSWER_CACHE_ENABLED:
+        return False
+    user_message = state["messages"][-1].content
+    if len(user_message.split()) < settings.ANSWER_CACHE_MIN_WORDS:
+        return False
+    return not state.get("history_snapshots") or parse_query_filter(user_message) is not None
+
+
+async def answer_cache_lookup(state: State) -> dict:
+    print("\n==== Answer Cache Lookup Triggered ====\n")
+
+    if not _answer_cacheable(state):
+        return {"answer_cacheable": False, "answer_cache_hit": False}
+
+    user_message = state["messages"][-1].content
+    try:
+        entry = await asyncio.to_thread(answer_cache.get, await aembed_query(user_message))
+    except Exception as e:
+        print(f"Answer Cache Lookup Node Error ! \nError in answer cache lookup: {e}")
+        return {"answer_cacheable": False, "answer_cache_hit": False}
+
+    if entry is None:
+        return {"answer_cacheable": True, "answer_cache_hit": False}
+
+    print(f"Answer cache hit (similarity {entry['similarity']:.3f}): {entry['question']}")
+    current_snapshot = conversation_memory.snapshot(state, entry["answer"])
+    return {
+        "answer": entry["answer"],
+        "hallucination_score": entry["hallucination_score"],
+        "answer_cacheable": True,
+        "answer_cache_hit": True,
+        **conversation_memory.record(state, current_snapshot, await conversation_memory.fold(state))
+    }
+
+
+def _answer_passed_checks(state: State) -> bool:
+    """Only answers that passed evaluation and the hallucination check are cached, anything else would be
+    served to every near-duplicate question for the whole TTL"""
+    answer = state.get("answer")
+    if not answer or answer == ANSWER_ERROR:
+        return False
+    hallucination_score = state.get("hallucination_score")
+    return (
+        state.get("confidence_score", 0) >= settings.EVALUATION_MIN_CONFIDENCE
+        and hallucination_score is not None and hallucination_score >= settings.HALLUCINATION_MIN_SCORE
+    )
+
+
+async def answer_cache_store(state: State) -> dict:
+    print("\n==== Answer Cache Store Triggered ====\n")
+
+    # online search results go stale and tool calls have side effects (files, chart urls)
+    used_tools = state.get("tavily_results") or state.get("csv_export_results") or state.get("chart_image_results")
+    if not state.get("answer_cacheable") or used_tools or state.get("safety_flag_answer"):
+        return {}
+    if not _answer_passed_checks(state):
+        print("Answer not cached: it did not pass evaluation / the hallucination check")
+        return {}
+
+    try:
+        user_message = state["messages"][-1].content
+        await asyncio.to_thread(
+            answer_cache.put, user_message, await aembed_query(user_message), state["answer"], state.get("hallucination_score")
+        )
+        print(f"Answer cached: {answer_cache.stats()}")
+    except Exception as e:
+        print(f"Answer Cache Store Node Error ! \nError in answer cache store: {e}")
+    return {}
+
+
 async def semantic_optimizer_filter(state: State) -> dict:
     print("\n==== Semantic Optimizer Triggered ====\n")
     
@@ -52,16 +158,21 @@ async def semantic_optimizer_filter(state: State) -> dict:
     optimized_query = "None"
     
     try:
-        response = await llm.ainvoke(messages)  
+        response = await get_llm("semantic_optimizer_filter").ainvoke(messages)  
         optimized_query = response.content.strip()
             
     except Exception as e:
         print(f"Semantic Optimizer Filter Node Error ! \nError parsing user message: {e}")
     
     print("\nsemantic optimizer filter response: ", optimized_query)
+
+    # states / years / crop types for scalar filtering, the user's own wording first
+    query_filter = parse_query_filter(user_message) or parse_query_filter(optimized_query)
+    print("query filter: ", query_filter)
     
     return {
         "optimized_query": optimized_query,
+        "query_filter": query_filter,
     }
     
 
@@ -77,7 +188,7 @@ async def semantic_search(state: State) -> dict:
             }
 
         # semantic search()
-        retrieved_docs = semantic_search_milvus(optimized_query, k)
+        retrieved_docs = await asemantic_search(optimized_query, k, state.get("query_filter"))
         
         print(f"Retrieved Docs Success: {bool(retrieved_docs)}")
         for doc in retrieved_docs:
@@ -97,6 +208,49 @@ async def semantic_search(state: State) -> dict:
         }
     
 
+async def _optimize_and_search(state: State) -> dict:
+    update = await semantic_optimizer_filter(state)
+    update.update(await semantic_search({**state, **update}))
+    return update
+
+
+async def _cancel(*tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def speculative_input(state: State) -> dict:
+    """Guard rail, answer cache lookup and optimize -> retrieve started together;
+    the speculative work is cancelled when the message is flagged or the cache already has the answer"""
+    print("\n==== Speculative Input Triggered ====\n")
+
+    guard_task = asyncio.create_task(guard_rail_messages(state))
+    cache_task = asyncio.create_task(answer_cache_lookup(state))
+    retrieval_task = asyncio.create_task(_optimize_and_search(state))
+
+    try:
+        # the cache lookup is an embedding away, the guard rail a full llm round trip
+        cache_update = await cache_task
+        if cache_update.get("answer_cache_hit"):
+            await _cancel(retrieval_task)
+
+        guard_update = await guard_task
+        if guard_update.get("safety_flag_messages"):
+            await _cancel(retrieval_task)
+            print("Message flagged, speculative retrieval discarded")
+            return guard_update
+
+        if cache_update.get("answer_cache_hit"):
+            return {**guard_update, **cache_update}
+        return {**guard_update, **cache_update, **await retrieval_task}
+
+    except BaseException:
+        # cancelled or one branch failed: no sibling task outlives the node
+        await _cancel(guard_task, cache_task, retrieval_task)
+        raise
+
+
 async def answer_generator(state: State) -> dict:
     print("\n==== Answer generator triggered ====\n")
     
@@ -107,49 +261,48 @@ async def answer_generator(state: State) -> dict:
     search_results = state["tavily_results"]
     csv_output_results = state["csv_export_results"]
     chart_output_results = state["chart_image_results"]
+    analytics_results = state.get("analytics_results")
     
-     # FIXED: Build context from stored history snapshots
-    past_context_data = state.get("history_snapshots", [])[-3:]  # Last 3 turns
-    past_context = json.dumps(past_context_data, indent=2) if past_context_data else None
+    past_context = conversation_memory.context(state)
     
     # print(f"+++Received past context by answer generator LEV 1+++ \n {past_context}")
     
     # Generate answer
     system_prompt, user_prompt = answer_prompt(
         user_message, retrieved_docs, search_results, feedback, 
-        past_context, csv_output_results, chart_output_results
+        past_context, csv_output_results, chart_output_results, analytics_results
     )
     
     
     messages = [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
-    llm_model = llm.with_structured_output(AnswerGenerationSchema)
+    llm_model = llm.with_structured_output(AnswerGenerationSchema).with_config(tags=[ANSWER_TAG]) # streamed to the ui
     
+    # turns leaving the memory window are folded into the digest beside the answer call
+    summary_task = asyncio.create_task(conversation_memory.fold(state))
     try:
         result = await llm_model.ainvoke(messages)
     except Exception as e:
         print(f"Answer Generator Node Error!\nError: {e}")
-        return {"answer": "Error generating answer"}
+        await _cancel(summary_task)
+        return {"answer": ANSWER_ERROR}
     
     # Debug logging
     print(f"\nPast context: {bool(past_context)}")
     print(f"Search results: {bool(search_results)}")
     print(f"CSV results: {bool(csv_output_results)}")
     print(f"Chart results: {bool(chart_output_results)}")
-    print(f"Flags - Search: {result.online_search_required}, CSV: {result.csv_export_required}, Chart: {result.chart_image_required}")
+    print(f"Analytics results: {bool(analytics_results)}")
+    print(f"Flags - Search: {result.online_search_required}, CSV: {result.csv_export_required}, Chart: {result.chart_image_required}, Analytics: {result.analytics_query_required}")
     print(f"User: {user_message}")
     print(f"Answer: {result.answer}")
     
     # print(f"+++Received serach result by answer generator LEV 2+++ \n {search_results}")
     
     
-    # Store current snapshot for next iteration
-    current_snapshot = {
-        "user_message": user_message,
-        "answer": result.answer,
-        "search_results_present": bool(search_results),
-        "csv_results_present": bool(csv_output_results),
-        "chart_results_present": bool(chart_output_results)
-    }
+    # Store current snapshot for next iteration, replaces the one of an earlier pass of this turn
+    current_snapshot = conversation_memory.snapshot(
+        state, result.answer, search_results, csv_output_results, chart_output_results
+    )
     
     # Prevent flag loops - only set True if results don't exist yet
     return {
@@ -157,8 +310,9 @@ async def answer_generator(state: State) -> dict:
         "csv_export_required": result.csv_export_required and not csv_output_results,
         "chart_image_required": result.chart_image_required and not chart_output_results,
         "online_search_required": result.online_search_required and not search_results,
+        "analytics_query_required": result.analytics_query_required and not analytics_results,
         "iteration_count": state["iteration_count"] + 1,
-        "history_snapshots": state.get("history_snapshots", []) + [current_snapshot]  # NEW
+        **conversation_memory.record(state, current_snapshot, await summary_task)
     }
 
 
@@ -169,7 +323,7 @@ async def evaluation(state: State) -> dict:
     retrieved_docs = state["retrieved_docs"]
 
 
-    system_prompt, user_prompt = evaluation_prompt(user_message, answer, retrieved_docs)
+    system_prompt, user_prompt = evaluation_prompt(user_message, answer, retrieved_docs, state.get("analytics_results"))
     messages = [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
 
     llm_model = llm.with_structured_output(EvaluationSchema)
@@ -197,29 +351,12 @@ async def tavily_search_node(state: State) -> dict:
     
     user_message = state["messages"][-1].content
     
-   # get past context
-    past_context_data = []
-    start_idx = max(0, len(state["messages"]) - 2)  # last 3 messages
-
-    for i in range(start_idx, len(state["messages"]) - 1):  # exclude the last one
-        msg_obj = state["messages"][i]
-        msg_content = msg_obj.content if hasattr(msg_obj, "content") else str(msg_obj)
-
-        snapshot = {
-            "history": {
-                "messages": [msg_content],
-                "answer": [state["answer"]] if state["answer"] else [None],
-            }
-        }
-        past_context_data.append(snapshot)
-
-    # convert to JSON string
-    past_context = json.dumps(past_context_data, indent=2)
+    past_context = conversation_memory.context(state)
     
     print(f"\n past context for tavily search received: {bool(past_context)} \n")
     
     try:
-        tools = await get_tools()
+        tools = await get_tools(TAVILY_SERVER)
         tavily_tool = next((t for t in tools if "search" in t.name.lower()), None)  # loop thru all tools and find the search tool
 
         if not tavily_tool:
@@ -253,6 +390,39 @@ async def tavily_search_node(state: State) -> dict:
         }
 
 
+async def analytics_query(state: State) -> dict:
+    print("\n==== Analytics query triggered ====\n")
+    
+    user_message = state["messages"][-1].content
+    past_context = conversation_memory.context(state)
+    
+    try:
+        system_prompt, user_prompt = analytics_query_prompt(user_message, past_context)
+        messages = [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
+        
+        # bind tool to LLM, the query itself runs locally over the crop table
+        llm_with_tools = llm.bind_tools([crop_data_tool], tool_choice=crop_data_tool.name)
+        response = await llm_with_tools.ainvoke(messages)
+        
+        tool_call = response.tool_calls[0]
+        result = await crop_data_tool.ainvoke(tool_call["args"])  # execute tool call
+        
+        print(f"Analytics query: {tool_call['args']}")
+        print(f"Analytics results:\n{result}")
+        
+        return {
+            "analytics_query_required": False,  # Reset flag after use
+            "analytics_results": result
+        }
+        
+    except Exception as e:
+        print(f"Analytics query error: {e}")
+        return {
+            "analytics_query_required": False,
+            "analytics_results": "Error running analytics query"
+        }
+
+
 async def csv_generator(state: State) -> dict:
     print("\n==== CSV generator triggered ====\n")
     
@@ -261,31 +431,11 @@ async def csv_generator(state: State) -> dict:
     data_context = state["retrieved_docs"]
     search_results = state["tavily_results"]
     
-     # get past context
-    past_context_data = []
-    start_idx = max(0, len(state["messages"]) - 3)  # last 3 messages
-
-    for i in range(start_idx, len(state["messages"]) - 1):  # exclude the last one
-        msg_obj = state["messages"][i]
-        msg_content = msg_obj.content if hasattr(msg_obj, "content") else str(msg_obj)
-
-        snapshot = {
-            "History": {
-                "messages": [msg_content],
-                "answer": [state["answer"]] if state["answer"] else [None],
-                "data_context": [state["retrieved_docs"]] if state["retrieved_docs"] else [None],
-                "search_results": [state["tavily_results"]] if state["tavily_results"] else [None],
-            }
-        }
-        past_context_data.append(snapshot)
-
-    # convert to JSON string
-    past_context = json.dumps(past_context_data, indent=2)
-
+    past_context = conversation_memory.context(state)
     
     print(f"\n past context for csv generation received: {bool(past_context)} \n")
     try:
-        tools = await get_tools()
+        tools = await get_tools(CSV_SERVER)
         csv_tool = next((t for t in tools if "csv" in t.name.lower()), None)
         
         if not csv_tool:
@@ -295,7 +445,8 @@ async def csv_generator(state: State) -> dict:
                 "csv_export_results": "Error: CSV generation tool not available."
             }
         
-        system_prompt, user_prompt = csv_generator_prompt(user_message, data_context, search_results, past_context)
+        system_prompt, user_prompt = csv_generator_prompt(user_message, past_context, data_context, search_results,
+                                                          analytics_results=state.get("analytics_results"))
         messages = [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
         
         # bind tools to LLM
@@ -331,11 +482,10 @@ async def chart_generator(state: State) -> dict:
 
     try:
         user_message = state["messages"][-1].content
-        past_context = None
         retrieved_docs = state.get("retrieved_docs", None)
         search_results = state.get("tavily_results", None)
 
-        tools = await get_tools()
+        tools = await get_tools(CHART_SERVER)
         chart_tool = next((t for t in tools if "chart" in t.name.lower()), None)
 
         if not chart_tool:
@@ -345,25 +495,10 @@ async def chart_generator(state: State) -> dict:
                 "chart_image_results": "Error: Chart tool not available."
             }
             
-        # get past context
-        past_context_data = []
-        start_idx = max(0, len(state["messages"]) - 3) # last 3
-        for i in range(start_idx, len(state["messages"]) - 1): # except last one
-            msg_obj = state["messages"][i]
-            msg_content = msg_obj.content if hasattr(msg_obj, "content") else str(msg_obj)
-            
-            snapshot = {
-                "History": {
-                "messages": [msg_content],
-                "answer": [state["answer"]] if state["answer"] else [None],
-                "data_context": [state["retrieved_docs"]] if state["retrieved_docs"] else [None],
-                "search_results": [state["tavily_results"]] if state["tavily_results"] else [None],
-                }}
-            past_context_data.append(snapshot)
-        
-        past_context = json.dumps(past_context_data, indent=2)
+        past_context = conversation_memory.context(state)
 
-        system_prompt, user_prompt = chart_generator_prompt(user_message, past_context, retrieved_docs, search_results)
+        system_prompt, user_prompt = chart_generator_prompt(user_message, past_context, retrieved_docs, search_results,
+                                                            analytics_results=state.get("analytics_results"))
 
         messages = [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
 
@@ -401,7 +536,7 @@ async def guard_rail_answer(state: State) -> dict:
         system_prompt, user_prompt = guard_rail_prompt_answer(answer)
         messages = [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
 
-        response = await llm.ainvoke(messages)
+        response = await get_llm("guard_rail_answer").ainvoke(messages)
         response_text = response.content.strip().upper()
         
         # Check if response contains TRUE (violating)
@@ -433,11 +568,11 @@ async def hallucination_calculator(state: dict) -> dict:
         retrieved_docs = state.get("retrieved_docs")
         search_results = state.get("search_results")
 
-        system_prompt, user_prompt = hallucination_prompt(answer, retrieved_docs, search_results)
+        system_prompt, user_prompt = hallucination_prompt(answer, retrieved_docs, search_results, state.get("analytics_results"))
 
         messages = [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
 
-        llm_with_schema = llm.with_structured_output(HallucinationResult)
+        llm_with_schema = get_llm("hallucination_calculator").with_structured_output(HallucinationResult)
         result = await llm_with_schema.ainvoke(messages)
 
         print(f"Hallucination score: {result.hallucination_score}")
@@ -453,3 +588,36 @@ async def hallucination_calculator(state: dict) -> dict:
         }
 
 
+async def post_checks_join(state: State) -> dict:
+    """Join point of the parallel evaluation / hallucination / output guard rail checks"""
+    print("\n==== Post Checks Joined ====\n")
+    return {}
+
+
+_background_tasks = set() # strong references until the checks finish
+
+
+async def _background_post_checks(state: State):
+    try:
+        update = {}
+        with track("post_checks_background_task", state.get("trace_id")):
+            for result in await asyncio.gather(hallucination_calculator(state), guard_rail_answer(state)):
+                update.update(result)
+        checked = {**state, **update}
+
+        save_query_answer(checked["messages"][-1].content, checked["answer"], {
+            "hallucination_score": checked.get("hallucination_score"),
+            "safety_flag_answer": checked.get("safety_flag_answer", False)
+        }, trace_id=checked.get("trace_id"), post_checks="background")
+        await answer_cache_store(checked)
+    except Exception as e:
+        print(f"Background Post Checks Error ! \nError in background post checks: {e}")
+
+
+async def post_checks_background(state: State) -> dict:
+    """Release the answer now; hallucination score and output guard rail run afterwards and are logged"""
+    print("\n==== Post Checks Scheduled In Background ====\n")
+    task = asyncio.create_task(_background_post_checks(dict(state)))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return {"post_checks_pending": True}
@@ -0,0 +1,155 @@
+import os
+import sys
+
+import numpy as np
+from config import settings
+
+HF_MODEL_ID = f"sentence-transformers/{settings.EMBEDDING_MODEL}"
+MAX_SEQ_LENGTH = 256 # all-MiniLM-L6-v2 max_seq_length
+
+
+class OnnxEmbeddings:
+    """MiniLM sentence embeddings on onnxruntime (mean pooling + L2 normalize), no torch needed at serving time"""
+
+    def __init__(self, model_dir=settings.ONNX_MODEL_DIR, quantized=settings.ONNX_QUANTIZED):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = settings.ONNX_THREADS
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        model_file = "model_int8.onnx" if quantized else "model.onnx"
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+    def _encode(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {
+            "input_ids": input_ids,
+            "attention_mask": attention_mask,
+            "token_type_ids": np.zeros_like(input_ids),
+        }
+        token_embeddings = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+
+        # same pooling as the sentence-transformers pipeline: mean over real tokens, then normalize
+        mask = attention_mask[..., None].astype(np.float32)
+        embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
+
+    def embed_documents(self, texts):
+        return self._encode(list(texts)).tolist()
+
+    def embed_query(self, text):
+        return self._encode([text])[0].tolist()
+
+
+def export_onnx(model_dir=settings.ONNX_MODEL_DIR, quantize=True):
+    """Export MiniLM to ONNX (needs torch + transformers once, offline) and optionally int8-quantize it"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(model_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(HF_MODEL_ID)
+    model = AutoModel.from_pretrained(HF_MODEL_ID).eval()
+    tokenizer.save_pretrained(model_dir) # writes tokenizer.json for the runtime
+
+    class Encoder(torch.nn.Module):
+        # fixed positional signature, transformers' forward() has many optional arguments
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(
+                input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+            ).last_hidden_state
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    model_path = os.path.join(model_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            Encoder(model),
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            model_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "token_type_ids": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=17,
+            dynamo=False,
+        )
+    print(f"ONNX model exported to {model_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized_path = os.path.join(model_dir, "model_int8.onnx")
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        print(f"int8 model written to {quantized_path}")
+
+
+def parity_check(queries, documents, k=5, quantized=settings.ONNX_QUANTIZED):
+    """Compare the ONNX backend against the torch backend: per-query cosine similarity and top-k overlap"""
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    torch_model = HuggingFaceEmbeddings(model_name=settings.EMBEDDING_MODEL, model_kwargs={"device": "cpu"})
+    onnx_model = OnnxEmbeddings(quantized=quantized)
+
+    def normalized(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    torch_queries = normalized(torch_model.embed_documents(queries))
+    onnx_queries = normalized(onnx_model.embed_documents(queries))
+    torch_docs = normalized(torch_model.embed_documents(documents))
+    onnx_docs = normalized(onnx_model.embed_documents(documents))
+
+    cosines = (torch_queries * onnx_queries).sum(axis=1)
+    overlaps = []
+    for torch_query, onnx_query in zip(torch_queries, onnx_queries):
+        torch_top = set(np.argsort(-(torch_docs @ torch_query))[:k])
+        onnx_top = set(np.argsort(-(onnx_docs @ onnx_query))[:k])
+        overlaps.append(len(torch_top & onnx_top) / k)
+
+    report = {
+        "quantized": quantized,
+        "queries": len(queries),
+        "documents": len(documents),
+        "cosine_min": float(cosines.min()),
+        "cosine_mean": float(cosines.mean()),
+        f"top{k}_overlap_min": float(min(overlaps)),
+        f"top{k}_overlap_mean": float(np.mean(overlaps)),
+    }
+    print(report)
+    return report
+
+
+if __name__ == "__main__":
+    # uv run agent/onnx_embeddings.py export | parity
+    command = sys.argv[1] if len(sys.argv) > 1 else "export"
+
+    if command == "export":
+        export_onnx()
+    elif command == "parity":
+        import pandas as pd
+        from utils.eval_data import read_records
+        from vector_store import row_to_text
+
+        queries = [record["user_message"] for record in read_records("eval/queries_with_results.jsonl")]
+        documents = [row_to_text(row) for _, row in pd.read_csv(settings.DATASET_CSV_PATH).iterrows()]
+        parity_check(queries, documents, k=13)
+    else:
+        print(f"Unknown command: {command} (expected export or parity)")
@@ -1,3 +1,6 @@
+from context_builder import docs_context
+
+
 def guard_rail_prompt_messages(user_message):
     system_prompt = """
 You are a helpful assistant that checks whether a user's message violates any guidelines.
@@ -56,7 +59,7 @@ Return only the optimized search query for semantic search (no explanations, no
 # reasoning _+ rules
 def answer_prompt(user_message, retrieved_docs=None, search_results=None, feedback=None, 
                   past_context=None, csv_output_results=None, 
-                  chart_output_results=None):
+                  chart_output_results=None, analytics_results=None):
 
     system_prompt = """
 # ROLE
@@ -64,8 +67,9 @@ You are an agriculture assistant specializing in PLANT agriculture only (crops,
 
 # DATA SOURCES PRIORITY
 1. **search_results** (if present) → Use this, ignore retrieved_docs
-2. **retrieved_docs** (if no search_results) → Use only if relevant to user query
-3. **csv_output_results / chart_output_results** (if present) → Summarize + return file/URL
+2. **analytics_results** (if present) → Exact numbers computed over the FULL dataset; use them for totals, rankings, averages and comparisons instead of retrieved_docs
+3. **retrieved_docs** (if no search_results) → Use only if relevant to user query
+4. **csv_output_results / chart_output_results** (if present) → Summarize + return file/URL
 
 # CORE RULES
 
@@ -87,6 +91,13 @@ You are an agriculture assistant specializing in PLANT agriculture only (crops,
 
 ## Tool Usage (ONE tool per query)
 
+### Exact Data Query
+**Trigger:** Question about the crop dataset that needs numbers over many rows: totals, averages, highest/lowest, top N, rankings, comparisons across states/years/crop types, trends, moving averages
+**Process:**
+1. Set `analytics_query_required = True` (answer field: short note, e.g. "Querying the dataset...")
+2. **When analytics_results present:** Answer from analytics_results (cite the dataset source) → Keep flag False
+3. If the user also wants a CSV or chart: run the data query first, then set the CSV/chart flag once analytics_results is present
+
 ### Online Search
 **Trigger:** Insufficient/irrelevant data in retrieved_docs
 **Process:**
@@ -133,7 +144,8 @@ You are an agriculture assistant specializing in PLANT agriculture only (crops,
   "answer": "Your response text",
   "csv_export_required": false,  // True = user requested CSV + relevant data available
   "chart_image_required": false, // True = user requested chart + relevant data available
-  "online_search_required": false // True = need to search online after user confirms
+  "online_search_required": false, // True = need to search online after user confirms
+  "analytics_query_required": false // True = need exact numbers from the dataset, analytics_results missing
 }
 ```
 
@@ -165,6 +177,7 @@ You are an agriculture assistant specializing in PLANT agriculture only (crops,
    - No tool keywords → Continue to step 5
 
 5. **Check data relevance:**
+   - Needs exact numbers over the dataset + analytics_results missing → `analytics_query_required = True`
    - retrieved_docs relevant → Generate answer from data → All flags False
    - retrieved_docs irrelevant/missing → Ask search confirmation → `online_search_required = False`
 
@@ -249,13 +262,15 @@ You are an agriculture assistant specializing in PLANT agriculture only (crops,
     if past_context:
         user_context += f"Conversation history: {past_context}\n"
     if retrieved_docs:
-        user_context += f"Retrieved documents: {retrieved_docs}\n"
+        user_context += f"Retrieved documents:\n{docs_context(retrieved_docs, 'answer_generator')}\n"
     if search_results:
         user_context += f"Online search results: {search_results}\n"
     if csv_output_results:
         user_context += f"CSV file generated: {csv_output_results}\n"
     if chart_output_results:
         user_context += f"Chart URL generated: {chart_output_results}\n"
+    if analytics_results:
+        user_context += f"Analytics results (exact, full dataset): {analytics_results}\n"
     if feedback:
         user_context += f"User feedback: {feedback}\n"
         
@@ -263,7 +278,7 @@ You are an agriculture assistant specializing in PLANT agriculture only (crops,
 
 
 
-def evaluation_prompt(user_message, answer, retrieved_docs=None):
+def evaluation_prompt(user_message, answer, retrieved_docs=None, analytics_results=None):
     system_prompt = """
 You are a helpful evaluator that rates the quality and completeness of an answer to a user's message about agriculture.
 
@@ -330,8 +345,11 @@ Return valid JSON according to this schema:
     user_prompt = f"""
 User message: {user_message}
 Answer: {answer}
-Retrieved docs: {retrieved_docs}
+Retrieved docs:
+{docs_context(retrieved_docs, "evaluation")}
 """
+    if analytics_results:
+        user_prompt += f"Analytics results (exact, full dataset): {analytics_results}\n"
     return system_prompt, user_prompt
 
 
@@ -373,11 +391,64 @@ DO NOT reveal your reasoning or the query itself.
 
 
 
-def csv_generator_prompt(user_message, past_context=None, retrieved_docs=None, search_results=None):
+def analytics_query_prompt(user_message, past_context=None):
+    user_context = f"User message: {user_message}\n"
+    if past_context:
+        user_context += f"Past context: {past_context}\n"
+
+    system_prompt = """
+You are a data analyst for the Malaysia crop dataset (DOSM, production and planted area of crops by state, 2017-2022).
+Translate the user's question into ONE call of the crop_data_query tool.
+
+DATA:
+- states: Johor, Kedah, Kelantan, Melaka, Negeri Sembilan, Pahang, Perak, Perlis, Pulau Pinang, Sabah, Sarawak, Selangor, Terengganu, W.P. Kuala Lumpur, W.P. Labuan
+- "Malaysia" rows are national totals; use states=["Malaysia"] only for country-level figures
+- crop_types: cash_crops, coconut, flower, fruits, herbs, industrial_crops, paddy, spices, vegetables (rice = paddy)
+- metrics: production (tonnes), planted_area (hectares), yield (tonnes per hectare)
+
+RULES:
+1. "highest/lowest/top N" → group_by the compared column, order desc/asc, top_n
+2. "trend / by year / over time" → group_by includes "year", order null
+3. "moving average" → group_by includes "year", rolling_window (default 3), order null
+4. "compare X and Y" → filter both and group_by the compared column
+5. Use past context only to resolve follow-ups ("what about Kedah?")
+"""
+
+    user_prompt = f"""
+{user_context}
+Call crop_data_query with the arguments that answer this question exactly.
+"""
+
+    return system_prompt, user_prompt
+
+
+def memory_summary_prompt(summary, turns, max_chars):
+    system_prompt = f"""
+You maintain a compact digest of an agriculture chat (Malaysia crop dataset) for later turns.
+Merge the existing digest with the older turns below into ONE updated digest.
+
+RULES:
+1. Keep what later questions may refer to: states, crops, years, figures, files or charts produced, open follow-ups
+2. Drop greetings, refusals and repeated details
+3. Plain bullet lines, no headings, at most {max_chars} characters
+"""
+
+    user_prompt = f"""
+Existing digest: {summary or "(empty)"}
+Older turns: {turns}
+Return only the updated digest.
+"""
+
+    return system_prompt, user_prompt
+
+
+def csv_generator_prompt(user_message, past_context=None, retrieved_docs=None, search_results=None, analytics_results=None):
     # Build unified context: prioritize user message, retrieved_docs, search_results. Use history only if needed.
     user_context = f"User message: {user_message}\n"
+    if analytics_results:
+        user_context += f"Analytics results (exact, full dataset): {analytics_results}\n"
     if retrieved_docs:
-        user_context += f"Retrieved docs: {retrieved_docs}\n"
+        user_context += f"Retrieved docs:\n{docs_context(retrieved_docs, 'csv_generator')}\n"
     if search_results:
         user_context += f"Online search data results: {search_results}\n"
     if past_context:
@@ -424,11 +495,13 @@ IMPORTANT:
     return system_prompt, user_prompt
 
 
-def chart_generator_prompt(user_message, past_context=None, retrieved_docs=None, search_results=None):
+def chart_generator_prompt(user_message, past_context=None, retrieved_docs=None, search_results=None, analytics_results=None):
     # Build unified context: prioritize retrieved docs and online search results, use history only if needed
     user_context = f"User message: {user_message}\n"
+    if analytics_results:
+        user_context += f"Analytics results (exact, full dataset): {analytics_results}\n"
     if retrieved_docs:
-        user_context += f"Retrieved docs: {retrieved_docs}\n"
+        user_context += f"Retrieved docs:\n{docs_context(retrieved_docs, 'chart_generator')}\n"
     if search_results:
         user_context += f"Online search data results: {search_results}\n"
     if past_context:
@@ -495,10 +568,12 @@ Return only: TRUE (violates) or FALSE (safe)
 
 
 
-def hallucination_prompt(answer, retrieved_docs=None, search_results=None):
+def hallucination_prompt(answer, retrieved_docs=None, search_results=None, analytics_results=None):
     user_context = f"Answer: {answer}\n"
+    if analytics_results:
+        user_context += f"Analytics Results: {analytics_results}\n"
     if retrieved_docs:
-        user_context += f"Retrieved Docs: {retrieved_docs}\n"
+        user_context += f"Retrieved Docs:\n{docs_context(retrieved_docs, 'hallucination_calculator')}\n"
     if search_results:
         user_context += f"Online Search Results: {search_results}\n"
 
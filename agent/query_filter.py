@@ -0,0 +1,124 @@
+import re
+
+import numpy as np
+
+# dataset vocabulary (database/data-collection/crops_state (1).csv)
+STATES = [
+    "Johor", "Kedah", "Kelantan", "Melaka", "Negeri Sembilan", "Pahang", "Perak", "Perlis",
+    "Pulau Pinang", "Sabah", "Sarawak", "Selangor", "Terengganu", "W.P. Kuala Lumpur", "W.P. Labuan",
+]
+CROP_TYPES = [
+    "cash_crops", "coconut", "flower", "fruits", "herbs", "industrial_crops", "paddy", "spices", "vegetables",
+]
+DATASET_YEARS = list(range(2017, 2023))
+
+STATE_ALIASES = {state.lower(): state for state in STATES} | {
+    "penang": "Pulau Pinang",
+    "pinang": "Pulau Pinang",
+    "malacca": "Melaka",
+    "negri sembilan": "Negeri Sembilan",
+    "n. sembilan": "Negeri Sembilan",
+    "kuala lumpur": "W.P. Kuala Lumpur",
+    "kl": "W.P. Kuala Lumpur",
+    "labuan": "W.P. Labuan",
+}
+CROP_TYPE_ALIASES = {
+    "cash crop": "cash_crops", "cash crops": "cash_crops",
+    "coconut": "coconut", "coconuts": "coconut",
+    "flower": "flower", "flowers": "flower",
+    "fruit": "fruits", "fruits": "fruits",
+    "herb": "herbs", "herbs": "herbs",
+    "industrial crop": "industrial_crops", "industrial crops": "industrial_crops",
+    "paddy": "paddy", "rice": "paddy",
+    "spice": "spices", "spices": "spices",
+    "vegetable": "vegetables", "vegetables": "vegetables", "veg": "vegetables", "veggies": "vegetables",
+}
+
+
+def _alias_pattern(aliases):
+    # longest alias first so "negeri sembilan" wins over shorter overlaps
+    alternation = "|".join(re.escape(alias) for alias in sorted(aliases, key=len, reverse=True))
+    return re.compile(rf"(?<![\w.])({alternation})(?![\w])")
+
+
+_STATE_PATTERN = _alias_pattern(STATE_ALIASES)
+_CROP_TYPE_PATTERN = _alias_pattern(CROP_TYPE_ALIASES)
+_YEAR_RANGE_PATTERN = re.compile(r"\b(20\d\d)\s*(?:-|–|to|until|till|and)\s*(20\d\d)\b")
+_YEAR_PATTERN = re.compile(r"\b20\d\d\b")
+
+
+def canonical_state(name):
+    return STATE_ALIASES.get(" ".join(str(name).lower().replace("_", " ").split()))
+
+
+def canonical_crop_type(name):
+    return CROP_TYPE_ALIASES.get(" ".join(str(name).lower().replace("_", " ").split()))
+
+
+def _unique(values):
+    return list(dict.fromkeys(values))
+
+
+def parse_query_filter(text):
+    """Fast local parser: states, years and crop types mentioned in a query, or None when nothing is found"""
+    if not text:
+        return None
+    lowered = " ".join(text.lower().replace("_", " ").split())
+
+    states = _unique(STATE_ALIASES[match] for match in _STATE_PATTERN.findall(lowered))
+    crop_types = _unique(CROP_TYPE_ALIASES[match] for match in _CROP_TYPE_PATTERN.findall(lowered))
+
+    years = []
+    for start, end in _YEAR_RANGE_PATTERN.findall(lowered):
+        first, last = sorted((int(start), int(end)))
+        years.extend(range(first, last + 1))
+    years.extend(int(year) for year in _YEAR_PATTERN.findall(_YEAR_RANGE_PATTERN.sub(" ", lowered)))
+
+    # outside the dataset range a year filter can only return nothing, so it is dropped
+    years = sorted(year for year in set(years) if year in DATASET_YEARS)
+    if len(years) == len(DATASET_YEARS):
+        years = []
+
+    query_filter = {"states": states, "years": years, "crop_types": crop_types}
+    return query_filter if any(query_filter.values()) else None
+
+
+def to_milvus_expr(query_filter):
+    """Milvus boolean expression for the scalar fields written by notebooks/ingestor.ipynb"""
+    if not query_filter:
+        return ""
+
+    clauses = []
+    if query_filter.get("states"):
+        clauses.append(f"state in {_quoted(query_filter['states'])}")
+    if query_filter.get("years"):
+        clauses.append(f"date in {_quoted(f'{year}-01-01' for year in query_filter['years'])}")
+    if query_filter.get("crop_types"):
+        clauses.append(f"crop_type in {_quoted(query_filter['crop_types'])}")
+    return " and ".join(clauses)
+
+
+def _quoted(values):
+    return "[" + ", ".join('"' + str(value).replace('"', '\\"') + '"' for value in values) + "]"
+
+
+
+def filter_columns(docs):
+    """Scalar columns used by candidate_mask, one entry per chunk"""
+    return {
+        "state": np.array([doc["state"] for doc in docs]),
+        "year": np.array([str(doc["date"])[:4] for doc in docs]),
+        "crop_type": np.array([doc["crop_type"] for doc in docs]),
+    }
+
+
+def candidate_mask(columns, query_filter):
+    """Boolean mask of the chunks matching the filter (local backends)"""
+    mask = np.ones(len(columns["state"]), dtype=bool)
+    if query_filter.get("states"):
+        mask &= np.isin(columns["state"], query_filter["states"])
+    if query_filter.get("years"):
+        mask &= np.isin(columns["year"], [str(year) for year in query_filter["years"]])
+    if query_filter.get("crop_types"):
+        mask &= np.isin(columns["crop_type"], query_filter["crop_types"])
+    return mask
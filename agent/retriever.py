@@ -1,54 +1,194 @@
-import torch
-from langchain_huggingface import HuggingFaceEmbeddings
-from pymilvus import MilvusClient
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from config import settings
+from lexical_index import load_lexical_index, reciprocal_rank_fusion
+from utils.embedding_cache import EmbeddingCache
+from vector_store import create_vector_store
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
-embeddings_model = HuggingFaceEmbeddings(
-    model_name='all-MiniLM-L6-v2', 
-    model_kwargs={'device': device}
+# torch, the embedding model and the vector client are created on first use (see warm_up)
+_embeddings_model = None
+_vector_store = None
+_lexical_index = None
+_embeddings_lock = threading.Lock()
+_vector_store_lock = threading.Lock()
+_lexical_index_lock = threading.Lock()
+
+
+def _embedding_model_id():
+    # vectors differ slightly between backends, so they are cached separately
+    if settings.EMBEDDING_BACKEND == "onnx":
+        return f"{settings.EMBEDDING_MODEL}:onnx{'-int8' if settings.ONNX_QUANTIZED else ''}"
+    return settings.EMBEDDING_MODEL
+
+
+# repeated optimized queries skip the forward pass
+embedding_cache = EmbeddingCache(
+    model_name=_embedding_model_id(),
+    path=settings.EMBEDDING_CACHE_PATH if settings.EMBEDDING_CACHE_ENABLED else None,
+    max_items=settings.EMBEDDING_CACHE_SIZE
 )
-client = MilvusClient(uri=settings.ZILLIZ_URL, token=settings.ZILLIZ_TOKEN)
-collection_name = settings.COLLECTION_NAME
-
-
-def semantic_search_milvus(query, k):
-    """Perform semantic search on Milvus"""
-    
-    query_vector = embeddings_model.embed_query(query)
-    
-    results = client.search(
-        collection_name=collection_name,
-        data=[query_vector],
-        limit=k,
-        output_fields=[
-            "text", 
-            
-            #"state", "date", "crop_type", "planted_area", "production",
-            "source", "dataset_name", "source_url", "data_year"
-            # "chunk_id", "created_at"
-        ]
-    )  
-    
-    # Return in json format
-    json_results = []
-    for hits in results:
-        for hit in hits:
-            json_results.append({
-                "text": hit['entity']['text'],
-                # "state": hit['entity']['state'],
-                # "date": hit['entity']['date'],
-                # "crop_type": hit['entity']['crop_type'],
-                # "planted_area": hit['entity']['planted_area'],
-                # "production": hit['entity']['production'],
-                # "source": hit['entity']['source'],
-                "dataset_name": hit['entity']['dataset_name'],
-                "source_url": hit['entity']['source_url'],
-                "data_year": hit['entity']['data_year'],
-                # "chunk_id": hit['entity']['chunk_id'],
-                # "created_at": hit['entity']['created_at'],
-                "score": hit['distance']
-            })
-    
-    return json_results
 
+# bounded pools so blocking work stays off the event loop
+_embed_executor = ThreadPoolExecutor(max_workers=settings.EMBED_MAX_WORKERS, thread_name_prefix="embed")
+_search_executor = ThreadPoolExecutor(max_workers=settings.SEARCH_MAX_WORKERS, thread_name_prefix="vector-search")
+
+
+def _load_embeddings_model():
+    if settings.EMBEDDING_BACKEND == "onnx":
+        from onnx_embeddings import OnnxEmbeddings
+
+        return OnnxEmbeddings()
+
+    import torch
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    return HuggingFaceEmbeddings(
+        model_name=settings.EMBEDDING_MODEL,
+        model_kwargs={'device': device}
+    )
+
+
+def get_embeddings_model():
+    """Embedding model singleton (torch or onnx, see settings.EMBEDDING_BACKEND), loaded on first call"""
+    global _embeddings_model
+    if _embeddings_model is None:
+        with _embeddings_lock:
+            if _embeddings_model is None:
+                _embeddings_model = _load_embeddings_model()
+    return _embeddings_model
+
+
+def embeddings_ready():
+    """True once the embedding model is loaded (by warm-up or a first query)"""
+    return _embeddings_model is not None
+
+
+def get_vector_store():
+    """Vector store singleton (milvus or local, see settings.VECTOR_BACKEND), opened on first call"""
+    global _vector_store
+    if _vector_store is None:
+        with _vector_store_lock:
+            if _vector_store is None:
+                _vector_store = create_vector_store()
+    return _vector_store
+
+
+def get_lexical_index():
+    """BM25 index singleton over the chunk text, loaded on first call"""
+    global _lexical_index
+    if _lexical_index is None:
+        with _lexical_index_lock:
+            if _lexical_index is None:
+                _lexical_index = load_lexical_index()
+    return _lexical_index
+
+
+def warm_up():
+    """Load the embedding model and open the vector store ahead of the first query"""
+    try:
+        get_embeddings_model().embed_query("warm up")
+        get_vector_store()
+        if settings.HYBRID_SEARCH_ENABLED:
+            get_lexical_index()
+        print("Retriever warm-up done")
+    except Exception as e:
+        print(f"Retriever warm-up failed: {e}")
+
+
+def close_retriever():
+    """Release the vector store client and the embedding cache, stop the worker pools"""
+    global _vector_store
+    with _vector_store_lock:
+        if _vector_store is not None:
+            _vector_store.close()
+            _vector_store = None
+    embedding_cache.close()
+    _embed_executor.shutdown(wait=False, cancel_futures=True)
+    _search_executor.shutdown(wait=False, cancel_futures=True)
+
+
+def embed_query(query):
+    """Embed a query, served from the embedding cache when possible"""
+    return embedding_cache.get_or_compute(query, lambda text: get_embeddings_model().embed_query(text))
+
+
+def semantic_search_milvus(query, k, query_filter=None):
+    """Perform semantic search on the configured vector store, fused with BM25 when hybrid search is enabled"""
+
+    query_vector = embed_query(query)
+    if not settings.HYBRID_SEARCH_ENABLED:
+        return _search(query_vector, k, query_filter)
+
+    depth = max(k, settings.HYBRID_CANDIDATES)
+    return _fuse(_search(query_vector, depth, query_filter), _lexical_search(query, depth, query_filter), k)
+
+
+def _search(query_vector, k, query_filter=None):
+    if query_filter:
+        docs = get_vector_store().search(query_vector, k, query_filter)
+        if docs:
+            return docs
+        print(f"No chunks match {query_filter}, searching without filter")
+    return get_vector_store().search(query_vector, k)
+
+
+def _lexical_search(query, k, query_filter=None):
+    try:
+        index = get_lexical_index()
+        if query_filter:
+            docs = index.search(query, k, query_filter)
+            if docs:
+                return docs
+        return index.search(query, k)
+    except Exception as e:
+        # dense results alone are still a valid answer
+        print(f"Lexical search failed, using dense results only: {e}")
+        return []
+
+
+def _fuse(dense_docs, lexical_docs, k):
+    # "score" stays the dense similarity (None for lexical-only hits), BM25 goes to "bm25_score"
+    lexical_docs = [doc | {"score": None, "bm25_score": doc["score"]} for doc in lexical_docs]
+    return reciprocal_rank_fusion(
+        [dense_docs, lexical_docs], [settings.DENSE_WEIGHT, settings.LEXICAL_WEIGHT], k
+    )
+
+
+async def aembed_query(query):
+    """Embed a query on the embedding pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await asyncio.wait_for(
+        loop.run_in_executor(_embed_executor, embed_query, query),
+        timeout=settings.EMBED_TIMEOUT
+    )
+
+
+async def asemantic_search(query, k, query_filter=None):
+    """Perform semantic search on the configured vector store without blocking the event loop,
+    restricted to the states / years / crop types in query_filter when given"""
+    loop = asyncio.get_running_loop()
+    depth = max(k, settings.HYBRID_CANDIDATES) if settings.HYBRID_SEARCH_ENABLED else k
+
+    # BM25 needs no embedding, it runs while the query is embedded and searched
+    lexical_future = None
+    if settings.HYBRID_SEARCH_ENABLED:
+        lexical_future = loop.run_in_executor(_search_executor, partial(_lexical_search, query, depth, query_filter))
+
+    try:
+        query_vector = await aembed_query(query)
+
+        # grpc deadline inside the call, plus an outer cap in case the pool is saturated
+        dense_docs = await asyncio.wait_for(
+            loop.run_in_executor(_search_executor, partial(_search, query_vector, depth, query_filter)),
+            timeout=settings.SEARCH_TIMEOUT + 1
+        )
+        if lexical_future is None:
+            return dense_docs
+        return _fuse(dense_docs, await lexical_future, k)
+    finally:
+        # on a timeout or cancellation the BM25 result is dropped, never left as an unretrieved future
+        if lexical_future is not None and not lexical_future.done():
+            lexical_future.cancel()
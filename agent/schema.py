@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import  List
+from typing import  List, Literal, Optional
 
 class EvaluationSchema(BaseModel):
     confidence_score: float = Field(description="Confidence score 0.0-1.0 based on retrieved data quality")
@@ -15,6 +15,8 @@ class AnswerGenerationSchema(BaseModel):
     online_search_required: bool = Field(
         default=False, 
         description="TRUE when: (1) data insufficient/irrelevant AND asking user to confirm search, OR (2) user confirms search with yes/ok/sure. FALSE when search_results is present.")
+    analytics_query_required: bool = Field(default=False,
+        description="TRUE when the question needs exact numbers from the crop dataset (totals, averages, highest/lowest, rankings, comparisons, moving averages) AND analytics_results is not present. FALSE otherwise.")
     
 # for chart generator node schema mcp
 class ChartDataset(BaseModel):
@@ -39,6 +41,25 @@ class TavilySearchSchema(BaseModel):
     tavily_results: List[OnlineSearchResult] = Field(description="List of results from Tavily search")
 
 
+# analytics node schema (crop_data_query tool)
+class CropDataQuery(BaseModel):
+    states: List[str] = Field(default_factory=list,
+        description="States to include, e.g. Johor, Kedah, Pulau Pinang. Empty = all states. 'Malaysia' = national totals only")
+    year_from: Optional[int] = Field(default=None, description="First year (dataset covers 2017-2022)")
+    year_to: Optional[int] = Field(default=None, description="Last year (inclusive)")
+    crop_types: List[str] = Field(default_factory=list,
+        description="cash_crops, coconut, flower, fruits, herbs, industrial_crops, paddy, spices, vegetables. Empty = all")
+    metric: Literal["production", "planted_area", "yield"] = Field(default="production",
+        description="production (tonnes), planted_area (hectares) or yield (tonnes per hectare)")
+    group_by: List[Literal["state", "year", "crop_type"]] = Field(default_factory=list,
+        description="Columns to group by, empty = one overall value")
+    aggregation: Literal["sum", "mean", "min", "max", "count"] = Field(default="sum", description="Aggregation per group")
+    order: Optional[Literal["asc", "desc"]] = Field(default="desc", description="Sort by value: desc = highest first")
+    top_n: Optional[int] = Field(default=None, description="Keep only the first N rows after sorting")
+    rolling_window: Optional[int] = Field(default=None,
+        description="Moving average window in years, requires 'year' in group_by")
+
+
 # CSV export node schema mcp
 class CsvExportResult(BaseModel):
     filename: str = Field(description="Filename of the CSV export created/generated")
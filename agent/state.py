@@ -5,14 +5,17 @@ class State(TypedDict):
     
     # entry point
     messages: Annotated[List[dict], add_messages] 
+    trace_id: Optional[str] # one per request, tags every node metric
     
     # answer generator node
     answer: Optional[str]
     
-    history_snapshots: list[dict] 
+    history_snapshots: list[dict] # last MEMORY_WINDOW_TURNS turns, see memory.py
+    history_summary: Optional[str] # digest of the turns before the window
     
     # From semantic optimizer filter node
     optimized_query: Optional[str]
+    query_filter: Optional[dict] # states, years, crop_types
     
     # semantic search node
     retrieved_docs: Optional[List[dict]] 
@@ -35,13 +38,24 @@ class State(TypedDict):
     chart_image_required: bool    
     chart_image_results: Optional[str] #retrn url
     
+    # analytics query node (local crop table + llm)
+    analytics_query_required: bool
+    analytics_results: Optional[str] # compact result table
+    
     # Guard Rail messages node
     safety_flag_messages: bool
     
+    # answer cache nodes
+    answer_cacheable: bool
+    answer_cache_hit: bool
+    
     # Guard Rail answer node
     safety_flag_answer: bool
     
     hallucination_score: Optional[float]
     
+    # background post-answer checks, logged by the background task
+    post_checks_pending: bool
+    
     
     
\ No newline at end of file
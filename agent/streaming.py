@@ -0,0 +1,83 @@
+import json
+
+ANSWER_NODE = "answer_generator"
+# set on the answer llm call only, other llm calls of the node (memory summary) stream beside it
+ANSWER_TAG = "answer_stream"
+
+# progress lines shown while a tool node runs, replaced by the next answer draft
+TOOL_PROGRESS = {
+    "speculative_input": "Searching the crop dataset...", # retrieval runs inside it by default
+    "semantic_search": "Searching the crop dataset...",
+    "analytics_query": "Computing exact figures from the crop table...",
+    "tavily_search": "Searching online...",
+    "csv_generator": "Generating the CSV file...",
+    "chart_generator": "Generating the chart...",
+}
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+def partial_json_string(buffer, key):
+    """Decoded value of a string field from a JSON object that is still being streamed, or None before it starts"""
+    marker = f'"{key}"'
+    start = buffer.find(marker)
+    if start < 0:
+        return None
+    position = buffer.find(":", start + len(marker))
+    if position < 0:
+        return None
+    position = buffer.find('"', position)
+    if position < 0:
+        return None
+
+    chars = []
+    i = position + 1
+    while i < len(buffer):
+        char = buffer[i]
+        if char == '"':
+            break
+        if char == "\\":
+            if i + 1 >= len(buffer):
+                break # escape split across chunks, wait for the next one
+            code = buffer[i + 1]
+            if code == "u":
+                if i + 6 > len(buffer):
+                    break
+                try:
+                    chars.append(json.loads(f'"{buffer[i:i + 6]}"'))
+                except ValueError:
+                    pass # lone surrogate half, dropped from the preview
+                i += 6
+                continue
+            chars.append(_ESCAPES.get(code, code))
+            i += 2
+            continue
+        chars.append(char)
+        i += 1
+    return "".join(chars)
+
+
+async def stream_answer(graph, initial_state, config):
+    """Yield the text to show while the graph runs: answer tokens as they are generated, progress lines for
+    tool nodes; every answer_generator run (tool loop, retry) replaces the previous draft"""
+    buffer = ""
+    shown = None
+    async for event in graph.astream_events(initial_state, config=config, version="v2"):
+        kind = event["event"]
+        node = event.get("metadata", {}).get("langgraph_node")
+
+        if kind == "on_chain_start" and event["name"] == node:
+            if node == ANSWER_NODE:
+                buffer, shown = "", None
+            elif node in TOOL_PROGRESS:
+                shown = None
+                yield f"_{TOOL_PROGRESS[node]}_"
+
+        elif kind == "on_chat_model_stream" and node == ANSWER_NODE and ANSWER_TAG in event.get("tags", []):
+            content = event["data"]["chunk"].content
+            if isinstance(content, str) and content:
+                buffer += content
+                draft = partial_json_string(buffer, "answer")
+                if draft and draft != shown: # trailing flag fields do not change the text
+                    shown = draft
+                    yield draft
@@ -0,0 +1,162 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+
+def dataset_version(csv_path):
+    """Content hash of the dataset file, answers computed on another version are never served"""
+    try:
+        with open(csv_path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()[:12]
+    except OSError:
+        return "unknown"
+
+
+class AnswerCache:
+    """Semantic answer cache: nearest cached question by cosine similarity, bounded LRU with TTL, SQLite backed"""
+
+    def __init__(self, scope, path, threshold=0.95, ttl=7 * 24 * 3600, max_items=1000):
+        self.scope = scope # dataset version + embedding model
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_items = max_items
+        self._entries = [] # dicts: id, question, answer, hallucination_score, created_at, last_hit
+        self._vectors = [] # unit-length float32 rows, same order as _entries
+        self._matrix = None # stacked _vectors, rebuilt lazily after changes
+        self._lock = threading.Lock()
+        self._hit_times = {} # row id -> last_hit not yet written, flushed with the next write or on close
+        self.hits = 0
+        self.misses = 0
+
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, scope TEXT, question TEXT, vector BLOB, "
+                "answer TEXT, hallucination_score REAL, created_at REAL, last_hit REAL)"
+            )
+            # other dataset versions and expired answers are dropped on start
+            self._db.execute(
+                "DELETE FROM answers WHERE scope != ? OR created_at < ?", (scope, time.time() - ttl)
+            )
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT id, question, vector, answer, hallucination_score, created_at, last_hit FROM answers "
+                "ORDER BY last_hit DESC LIMIT ?", (max_items,)
+            ).fetchall()
+            for row_id, question, vector, answer, score, created_at, last_hit in reversed(rows):
+                self._append({
+                    "id": row_id, "question": question, "answer": answer, "hallucination_score": score,
+                    "created_at": created_at, "last_hit": last_hit,
+                }, np.frombuffer(vector, dtype=np.float32))
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _append(self, entry, vector):
+        self._entries.append(entry)
+        self._vectors.append(vector)
+        self._matrix = None
+
+    def _remove(self, position):
+        entry = self._entries.pop(position)
+        self._vectors.pop(position)
+        self._matrix = None
+        if self._db is not None and entry["id"] is not None:
+            self._hit_times.pop(entry["id"], None)
+            self._db.execute("DELETE FROM answers WHERE id = ?", (entry["id"],)) # committed by the caller
+
+    def _nearest(self, vector):
+        if not self._entries:
+            return None, 0.0
+        if self._matrix is None:
+            self._matrix = np.vstack(self._vectors)
+        similarities = self._matrix @ vector
+        position = int(np.argmax(similarities))
+        return position, float(similarities[position])
+
+    def _flush_hits(self):
+        if self._db is not None and self._hit_times:
+            self._db.executemany(
+                "UPDATE answers SET last_hit = ? WHERE id = ?",
+                [(last_hit, row_id) for row_id, last_hit in self._hit_times.items()]
+            )
+        self._hit_times.clear()
+
+    def get(self, vector):
+        """Cached answer for the nearest question above the threshold, or None.
+        Blocking (sqlite), call it from a worker thread; a hit only updates memory, last_hit is written later"""
+        vector = self._unit(vector)
+        with self._lock:
+            position, similarity = self._nearest(vector)
+            if position is not None and time.time() - self._entries[position]["created_at"] > self.ttl:
+                self._remove(position)
+                if self._db is not None:
+                    self._db.commit()
+                position, similarity = self._nearest(vector)
+
+            if position is None or similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            entry = self._entries[position]
+            entry["last_hit"] = time.time()
+            if entry["id"] is not None:
+                self._hit_times[entry["id"]] = entry["last_hit"]
+            self.hits += 1
+            return entry | {"similarity": similarity}
+
+    def put(self, question, vector, answer, hallucination_score):
+        """Store an answer, evictions, pending hit times and the insert go in one commit. Blocking like get"""
+        vector = self._unit(vector)
+        now = time.time()
+        with self._lock:
+            # a near-duplicate question replaces the older answer
+            position, similarity = self._nearest(vector)
+            if position is not None and similarity >= self.threshold:
+                self._remove(position)
+
+            while len(self._entries) >= self.max_items:
+                self._remove(min(range(len(self._entries)), key=lambda i: self._entries[i]["last_hit"]))
+
+            row_id = None
+            if self._db is not None:
+                cursor = self._db.execute(
+                    "INSERT INTO answers (scope, question, vector, answer, hallucination_score, created_at, last_hit) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self.scope, question, vector.tobytes(), answer, hallucination_score, now, now)
+                )
+                self._flush_hits()
+                self._db.commit()
+                row_id = cursor.lastrowid
+            self._append({
+                "id": row_id, "question": question, "answer": answer, "hallucination_score": hallucination_score,
+                "created_at": now, "last_hit": now,
+            }, vector)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._flush_hits()
+                self._db.commit()
+                self._db.close()
+                self._db = None
@@ -0,0 +1,254 @@
+import asyncio
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+import httpx
+from langchain_core.tools import StructuredTool
+
+from config import settings
+
+
+def _digest(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()
+
+
+def _first_line(text):
+    return next((line.strip() for line in str(text or "").splitlines() if line.strip()), "")
+
+
+class Cassette:
+    """Record / replay of every LLM request (llm.py) and MCP tool call (mcp_client.py) in one gzipped JSONL file.
+
+    Entries are matched on the exact request (model, messages, schema, tools / tool arguments). When the prompt
+    differs (e.g. other retrieved docs) a replay falls back to the recorded calls of the same shape: same schema or
+    tools and the same first line of the user prompt (the "User message: ..." line), in recorded order."""
+
+    def __init__(self, path, mode="off", replay_latency=False):
+        self.path = path
+        self.mode = mode # off | record | replay
+        self.replay_latency = replay_latency # sleep the recorded latency before answering
+        self.counters = defaultdict(int)
+        self._exact = defaultdict(deque) # key -> recorded entries, served in order, the last one repeats
+        self._loose = defaultdict(deque) # the same entries by loose key
+        self._consumed = set() # load positions of served entries, skipped by the other index
+        self._tool_specs = {} # server -> recorded tool listing
+        self._wrapped = {} # (server, tool name) -> (live tool, recording wrapper)
+        self._file = None
+        self._lock = threading.Lock()
+        if mode == "replay":
+            self._load()
+
+    @property
+    def recording(self):
+        return self.mode == "record"
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            print(f"Cassette not found at {self.path}, every call will miss")
+            return
+        seq = 0
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break # tail of an interrupted recording
+                if entry["kind"] == "tools":
+                    self._tool_specs[entry["server"]] = entry["tools"]
+                    continue
+                entry["_seq"] = seq
+                seq += 1
+                self._exact[(entry["kind"], entry["key"])].append(entry)
+                self._loose[(entry["kind"], entry["loose_key"])].append(entry)
+        print(f"Cassette loaded from {self.path}: {sum(len(entries) for entries in self._exact.values())} calls")
+
+    def _write(self, entry):
+        with self._lock:
+            try:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    self._file = gzip.open(self.path, "at", encoding="utf-8") # one gzip member per recording run
+                self._file.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+                self._file.flush() # readable up to here if the process dies
+                self.counters[f"{entry['kind']}_recorded"] += 1
+            except OSError as e:
+                print(f"Cassette write failed: {e}")
+
+    def _next(self, entries):
+        # entries already served through the other index are skipped, the last one still repeats
+        while len(entries) > 1 and entries[0]["_seq"] in self._consumed:
+            entries.popleft()
+        entry = entries.popleft() if len(entries) > 1 else entries[0]
+        self._consumed.add(entry["_seq"])
+        return entry
+
+    def _take(self, kind, key, loose_key):
+        with self._lock:
+            for index, match in ((self._exact, key), (self._loose, loose_key)):
+                entries = index.get((kind, match))
+                if entries:
+                    self.counters[f"{kind}_{'hits' if index is self._exact else 'loose_hits'}"] += 1
+                    return self._next(entries)
+            self.counters[f"{kind}_misses"] += 1
+            return None
+
+    async def _delay(self, entry):
+        if self.replay_latency and entry.get("latency_ms"):
+            await asyncio.sleep(entry["latency_ms"] / 1000)
+
+    # LLM requests
+
+    @staticmethod
+    def request_keys(request):
+        """Exact and loose key of a chat completions request"""
+        try:
+            body = json.loads(request.content or b"{}")
+        except ValueError:
+            body = {"raw": request.content.decode("utf-8", "replace")}
+        key = _digest({"method": request.method, "path": request.url.path, "body": body})
+        messages = body.get("messages") or [{}]
+        response_format = body.get("response_format") or {}
+        loose_key = _digest({
+            "path": request.url.path,
+            "model": body.get("model"),
+            "stream": body.get("stream", False),
+            "schema": (response_format.get("json_schema") or {}).get("name") or response_format.get("type"),
+            "tools": sorted(tool.get("function", {}).get("name", "") for tool in body.get("tools") or []),
+            "prompt": _first_line(messages[-1].get("content")),
+        })
+        return key, loose_key, body
+
+    def http_async_client(self):
+        """httpx client for ChatOpenAI, None (library default) when the cassette is off"""
+        if self.mode == "off":
+            return None
+        return httpx.AsyncClient(transport=CassetteTransport(self), timeout=None)
+
+    # MCP tools
+
+    def tools(self, server_name, tools):
+        """Tools of an MCP server wrapped so their calls are recorded; the listing is recorded once per server"""
+        if server_name not in self._tool_specs:
+            self._tool_specs[server_name] = [
+                {
+                    "name": tool.name,
+                    "description": tool.description,
+                    "args_schema": tool.args_schema if isinstance(tool.args_schema, dict)
+                    else tool.args_schema.model_json_schema(),
+                }
+                for tool in tools
+            ]
+            self._write({"kind": "tools", "server": server_name, "tools": self._tool_specs[server_name]})
+
+        wrapped = []
+        for tool in tools:
+            cached = self._wrapped.get((server_name, tool.name))
+            if cached is None or cached[0] is not tool: # a restarted session has new tool objects
+                cached = (tool, self._tool(server_name, tool.name, tool.description, tool.args_schema, tool))
+                self._wrapped[(server_name, tool.name)] = cached
+            wrapped.append(cached[1])
+        return wrapped
+
+    def replay_tools(self, server_name=None):
+        """Recorded tool listing served without starting any MCP server"""
+        servers = [server_name] if server_name else list(self._tool_specs)
+        tools = []
+        for server in servers:
+            for spec in self._tool_specs.get(server, []):
+                if (server, spec["name"]) not in self._wrapped:
+                    tool = self._tool(server, spec["name"], spec["description"], spec["args_schema"])
+                    self._wrapped[(server, spec["name"])] = (None, tool)
+                tools.append(self._wrapped[(server, spec["name"])][1])
+        if not tools:
+            print(f"Cassette has no tools recorded for '{server_name or 'any server'}'")
+        return tools
+
+    def _tool(self, server_name, name, description, args_schema, live_tool=None):
+        async def call_tool(**arguments):
+            key = _digest({"server": server_name, "tool": name, "args": arguments})
+            loose_key = _digest({"server": server_name, "tool": name})
+            if self.replaying:
+                entry = self._take("tool", key, loose_key)
+                if entry is None:
+                    raise RuntimeError(f"Cassette miss: no recorded call of tool '{name}' on '{server_name}'")
+                await self._delay(entry)
+                return entry["result"]
+
+            started = time.perf_counter()
+            result = await live_tool.ainvoke(arguments)
+            self._write({
+                "kind": "tool", "key": key, "loose_key": loose_key, "server": server_name, "tool": name,
+                "args": arguments, "result": result, "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            })
+            return result
+
+        return StructuredTool(
+            name=name,
+            description=description or "",
+            args_schema=args_schema,
+            coroutine=call_tool,
+            metadata={"cassette": self.mode, "server": server_name},
+        )
+
+    def stats(self):
+        return {"mode": self.mode, **self.counters}
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class CassetteTransport(httpx.AsyncBaseTransport):
+    """Sits under the OpenAI client: records the live exchange, or answers from the cassette without network"""
+
+    def __init__(self, cassette, transport=None):
+        self.cassette = cassette
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request):
+        key, loose_key, body = self.cassette.request_keys(request)
+
+        if self.cassette.replaying:
+            entry = self.cassette._take("llm", key, loose_key)
+            if entry is None:
+                # a 4xx is not retried by the OpenAI client, the node sees the error at once
+                return httpx.Response(400, json={"error": {
+                    "message": f"Cassette miss: no recorded response for request {key[:12]}", "type": "cassette_miss"
+                }})
+            await self.cassette._delay(entry)
+            return httpx.Response(entry["status"], headers=entry["headers"], content=entry["body"].encode("utf-8"))
+
+        started = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        # streamed answers are buffered while recording, replay still serves them as a stream
+        content = await response.aread()
+        await response.aclose()
+        # body stored decoded, only its type is kept from the headers (no cookies / org ids on disk)
+        headers = {"content-type": response.headers.get("content-type", "application/json")}
+        self.cassette._write({
+            "kind": "llm", "key": key, "loose_key": loose_key, "request": body,
+            "status": response.status_code, "headers": headers, "body": content.decode("utf-8", "replace"),
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+        return httpx.Response(response.status_code, headers=headers, content=content)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+cassette = Cassette(settings.CASSETTE_PATH, settings.CASSETTE_MODE, settings.CASSETTE_REPLAY_LATENCY)
+atexit.register(cassette.close)
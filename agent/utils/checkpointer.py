@@ -0,0 +1,252 @@
+import asyncio
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import aiosqlite
+from langgraph.checkpoint.base import get_checkpoint_metadata
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+
+class BoundedMemorySaver(MemorySaver):
+    """In-memory checkpointer that forgets idle threads (LRU + idle TTL) and keeps only the latest
+    checkpoints of each thread, so memory follows the active sessions instead of the total traffic"""
+
+    def __init__(self, max_threads=1000, ttl=3600, max_checkpoints=20):
+        super().__init__()
+        self.max_threads = max_threads
+        self.ttl = ttl # seconds a thread may stay idle
+        self.max_checkpoints = max_checkpoints # per thread and namespace
+        self._last_used = OrderedDict() # thread_id -> last read/write time, least recent first
+        self._lock = threading.Lock()
+        self.evicted_threads = 0
+        self.pruned_checkpoints = 0
+
+    def _touch(self, thread_id):
+        with self._lock:
+            self._last_used[thread_id] = time.time()
+            self._last_used.move_to_end(thread_id)
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"].get("thread_id")
+        if thread_id not in self.storage:
+            return None # reading a new or evicted thread must not create an empty entry in the defaultdict
+        self._touch(thread_id)
+        return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        result = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            self._prune(thread_id, config["configurable"]["checkpoint_ns"])
+        self._touch(thread_id)
+        self._evict(keep=thread_id)
+        return result
+
+    def _prune(self, thread_id, checkpoint_ns):
+        """Drop the oldest checkpoints of a thread, their pending writes and the blobs no kept checkpoint uses"""
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.max_checkpoints:
+            return
+        # checkpoint ids are time ordered (uuid6), the same order get_tuple relies on for the latest one
+        ordered = sorted(checkpoints)
+        for checkpoint_id in ordered[:-self.max_checkpoints]:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            self.pruned_checkpoints += 1
+
+        referenced = set()
+        for serialized, _, _ in checkpoints.values():
+            referenced.update(self.serde.loads_typed(serialized)["channel_versions"].items())
+        for key in [key for key in self.blobs if key[0] == thread_id and key[1] == checkpoint_ns]:
+            if (key[2], key[3]) not in referenced:
+                del self.blobs[key]
+
+    def _evict(self, keep=None):
+        with self._lock:
+            expired = time.time() - self.ttl
+            stale = {thread_id for thread_id, used in self._last_used.items() if used < expired}
+            overflow = len(self._last_used) - len(stale) - self.max_threads
+            if overflow > 0:
+                stale.update([thread_id for thread_id in self._last_used if thread_id not in stale][:overflow])
+            stale.discard(keep)
+            if not stale:
+                return
+            for thread_id in stale:
+                del self._last_used[thread_id]
+                self.storage.pop(thread_id, None)
+            # one pass over writes / blobs for all evicted threads
+            for store in (self.writes, self.blobs):
+                for key in [key for key in store if key[0] in stale]:
+                    del store[key]
+            self.evicted_threads += len(stale)
+
+    def delete_thread(self, thread_id):
+        with self._lock:
+            self._last_used.pop(thread_id, None)
+        super().delete_thread(thread_id)
+
+    def stats(self):
+        checkpoints = sum(len(namespaces) for thread in self.storage.values() for namespaces in thread.values())
+        size = sum(
+            len(serialized[1]) + len(metadata[1]) # dumps_typed gives (type, bytes) pairs
+            for thread in self.storage.values()
+            for namespaces in thread.values()
+            for serialized, metadata, _ in namespaces.values()
+        )
+        size += sum(len(data) for _, data in self.blobs.values())
+        size += sum(len(write[2][1]) for writes in self.writes.values() for write in writes.values())
+        return {
+            "threads": len(self.storage),
+            "checkpoints": checkpoints,
+            "blobs": len(self.blobs),
+            "writes": sum(len(writes) for writes in self.writes.values()),
+            "bytes": size, # serialized payloads, excludes dict overhead
+            "evicted_threads": self.evicted_threads,
+            "pruned_checkpoints": self.pruned_checkpoints,
+        }
+
+
+class CompressedSerializer:
+    """Default msgpack serializer with zlib on payloads above min_size (state carries retrieved docs and messages)"""
+
+    def __init__(self, serde=None, min_size=512, level=6):
+        self.serde = serde or JsonPlusSerializer()
+        self.min_size = min_size
+        self.level = level
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def dumps(self, obj):
+        return self.serde.dumps(obj)
+
+    def loads(self, data):
+        return self.serde.loads(data)
+
+    def dumps_typed(self, obj):
+        type_, data = self.serde.dumps_typed(obj)
+        self.raw_bytes += len(data)
+        if len(data) >= self.min_size:
+            type_, data = f"{type_}+zlib", zlib.compress(data, self.level)
+        self.stored_bytes += len(data)
+        return type_, data
+
+    def loads_typed(self, data):
+        type_, payload = data
+        if type_.endswith("+zlib"):
+            return self.serde.loads_typed((type_[:-len("+zlib")], zlib.decompress(payload)))
+        return self.serde.loads_typed(data)
+
+
+class SqliteCheckpointSaver(AsyncSqliteSaver):
+    """Durable checkpointer on a SQLite file in WAL mode, shared by every worker process on the host:
+    compressed state, one transaction per checkpoint (row, session timestamp, pruning), idle sessions evicted"""
+
+    def __init__(self, path, ttl=3600, max_checkpoints=20, compress_min_size=512, evict_every=200):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # must be created on the event loop that serves the graph
+        super().__init__(aiosqlite.connect(path), serde=CompressedSerializer(min_size=compress_min_size))
+        self.path = path
+        self.ttl = ttl # seconds a thread may stay idle
+        self.max_checkpoints = max_checkpoints # per thread and namespace
+        self.evict_every = evict_every # puts between idle-thread sweeps
+        self._setup_lock = asyncio.Lock()
+        self._ready = False
+        self.puts = 0
+        self.pruned_checkpoints = 0
+        self.evicted_threads = 0
+
+    async def setup(self):
+        async with self._setup_lock:
+            if self._ready:
+                return
+            await super().setup()
+            async with self.lock:
+                # WAL (set by the base schema) + synchronous=NORMAL: no fsync per commit, still crash safe
+                await self.conn.executescript(
+                    "PRAGMA synchronous=NORMAL;"
+                    "PRAGMA busy_timeout=5000;"
+                    "CREATE TABLE IF NOT EXISTS threads (thread_id TEXT PRIMARY KEY, last_used REAL);"
+                )
+                await self.conn.commit()
+            self._ready = True
+        await self.evict_idle()
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        await self.setup()
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        type_, serialized_checkpoint = self.serde.dumps_typed(checkpoint)
+        serialized_metadata = self.jsonplus_serde.dumps(get_checkpoint_metadata(config, metadata))
+
+        async with self.lock:
+            await self.conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+                "type, checkpoint, metadata) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 type_, serialized_checkpoint, serialized_metadata)
+            )
+            await self.conn.execute(
+                "INSERT OR REPLACE INTO threads (thread_id, last_used) VALUES (?, ?)", (thread_id, time.time())
+            )
+            # keep the latest max_checkpoints (ids are time ordered), then the writes of the dropped ones
+            cursor = await self.conn.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ("
+                "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                "ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?)",
+                (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.max_checkpoints - 1)
+            )
+            if cursor.rowcount > 0:
+                self.pruned_checkpoints += cursor.rowcount
+                await self.conn.execute(
+                    "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ("
+                    "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?)",
+                    (thread_id, checkpoint_ns, thread_id, checkpoint_ns)
+                )
+            await self.conn.commit()
+
+        self.puts += 1
+        if self.puts % self.evict_every == 0:
+            await self.evict_idle()
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    async def evict_idle(self):
+        """Delete threads no worker has written for ttl seconds"""
+        expired = time.time() - self.ttl
+        async with self.lock:
+            for table in ("checkpoints", "writes"):
+                await self.conn.execute(
+                    f"DELETE FROM {table} WHERE thread_id IN (SELECT thread_id FROM threads WHERE last_used < ?)",
+                    (expired,)
+                )
+            cursor = await self.conn.execute("DELETE FROM threads WHERE last_used < ?", (expired,))
+            self.evicted_threads += max(cursor.rowcount, 0)
+            await self.conn.commit()
+
+    async def adelete_thread(self, thread_id):
+        await super().adelete_thread(thread_id)
+        async with self.lock:
+            await self.conn.execute("DELETE FROM threads WHERE thread_id = ?", (str(thread_id),))
+            await self.conn.commit()
+
+    async def aclose(self):
+        await self.conn.close()
+
+    def stats(self):
+        return {
+            "checkpoints_written": self.puts,
+            "raw_bytes": self.serde.raw_bytes,
+            "stored_bytes": self.serde.stored_bytes, # after compression
+            "evicted_threads": self.evicted_threads,
+            "pruned_checkpoints": self.pruned_checkpoints,
+        }
@@ -0,0 +1,103 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """Two-tier query embedding cache: bounded in-memory LRU in front of a persistent SQLite store"""
+
+    def __init__(self, model_name, path, max_items=1024):
+        self.model_name = model_name
+        self.path = path
+        self.max_items = max_items
+        self._memory = OrderedDict() # key -> list[float]
+        self._lock = threading.Lock() # embeddings are computed on a thread pool
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA mmap_size=67108864") # memory-mapped reads
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, model TEXT, vector BLOB, created_at REAL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def normalize(text):
+        # all-MiniLM-L6-v2 is uncased, so case and spacing never change the vector
+        return " ".join(text.split()).lower()
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model_name}\x00{self.normalize(text)}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def get(self, text):
+        """Return the cached vector for text, or None"""
+        key = self._key(text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+
+            if self._db is not None:
+                row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32).tolist()
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, text, vector):
+        key = self._key(text)
+        with self._lock:
+            self._remember(key, list(vector))
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, model, vector, created_at) VALUES (?, ?, ?, ?)",
+                    (key, self.model_name, np.asarray(vector, dtype=np.float32).tobytes(), time.time())
+                )
+                self._db.commit()
+
+    def get_or_compute(self, text, embed_fn):
+        """Return the cached vector for text, computing and storing it with embed_fn on a miss"""
+        vector = self.get(text)
+        if vector is None:
+            vector = embed_fn(text)
+            self.put(text, vector)
+        return vector
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_size": len(self._memory),
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
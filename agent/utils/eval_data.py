@@ -0,0 +1,19 @@
+import json
+
+
+def read_records(path):
+    """Read a query/answer log, both pretty-printed (indent=2) records and one record per line"""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+
+    decoder = json.JSONDecoder()
+    records = []
+    index = 0
+    while True:
+        while index < len(text) and text[index].isspace():
+            index += 1
+        if index >= len(text):
+            break
+        record, index = decoder.raw_decode(text, index)
+        records.append(record)
+    return records
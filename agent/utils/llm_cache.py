@@ -0,0 +1,105 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from langchain_core.caches import BaseCache
+
+
+class LRUCache(BaseCache):
+    """Bounded in-memory LLM cache, least recently used entries evicted first"""
+
+    def __init__(self, max_items=2048):
+        self.max_items = max_items
+        self._memory = OrderedDict() # sha256(prompt, llm_string) -> generations
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(prompt, llm_string):
+        # prompt is the serialized message list, llm_string holds the model, params, tools and schema
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        key = self._key(prompt, llm_string)
+        with self._lock:
+            generations = self._memory.get(key)
+            if generations is not None:
+                self._memory.move_to_end(key)
+            return generations
+
+    def update(self, prompt, llm_string, return_val):
+        key = self._key(prompt, llm_string)
+        with self._lock:
+            self._memory[key] = return_val
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._memory.clear()
+
+    async def alookup(self, prompt, llm_string):
+        return self.lookup(prompt, llm_string)
+
+    async def aupdate(self, prompt, llm_string, return_val):
+        self.update(prompt, llm_string, return_val)
+
+    async def aclear(self, **kwargs):
+        self.clear()
+
+
+class CountingCache(BaseCache):
+    """Per-node view of a shared backend cache that counts hits and misses; cache errors never fail the call"""
+
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+
+    def _count(self, generations):
+        if generations is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return generations
+
+    def lookup(self, prompt, llm_string):
+        try:
+            return self._count(self.backend.lookup(prompt, llm_string))
+        except Exception as e:
+            print(f"LLM cache lookup failed ({self.name}): {e}")
+            return self._count(None)
+
+    def update(self, prompt, llm_string, return_val):
+        try:
+            self.backend.update(prompt, llm_string, return_val)
+        except Exception as e:
+            print(f"LLM cache update failed ({self.name}): {e}")
+
+    def clear(self, **kwargs):
+        self.backend.clear(**kwargs)
+
+    async def alookup(self, prompt, llm_string):
+        try:
+            return self._count(await self.backend.alookup(prompt, llm_string))
+        except Exception as e:
+            print(f"LLM cache lookup failed ({self.name}): {e}")
+            return self._count(None)
+
+    async def aupdate(self, prompt, llm_string, return_val):
+        try:
+            await self.backend.aupdate(prompt, llm_string, return_val)
+        except Exception as e:
+            print(f"LLM cache update failed ({self.name}): {e}")
+
+    async def aclear(self, **kwargs):
+        await self.backend.aclear(**kwargs)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
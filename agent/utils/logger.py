@@ -1,26 +1,149 @@
+import atexit
+import gzip
 import json
 import os
+import queue
+import shutil
+import threading
+import time
 from datetime import datetime
 
-# Overwrite the log file at module load (session start)
+from config import settings
+
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-eval_dir = os.path.join(project_root, "eval")
-os.makedirs(eval_dir, exist_ok=True)
+file_path = os.path.join(project_root, "eval", "query_answer_result.jsonl")
+
+_STOP = object()
+
+
+class EventLog:
+    """Structured JSONL event log written by a background thread: callers only enqueue, records are flushed in
+    batches, the file rotates by size / age (optionally gzipped) and the queue is drained on close"""
+
+    def __init__(self, path, flush_interval=1.0, batch_size=100, max_bytes=50 * 1024 * 1024,
+                 rotate_interval=24 * 3600, compress=True):
+        self.path = path
+        self.flush_interval = flush_interval # seconds between flushes of a partial batch
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval # seconds, 0 to rotate by size only
+        self.compress = compress
+        self.written = 0
+        self.failed = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._opened_at = None # when the current file was started, read from the file on the first write
+
+    def log(self, record):
+        """Enqueue one record, never blocks on disk"""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+                    self._thread.start()
+        self._queue.put(record)
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                record = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                record = None
+            if record is _STOP:
+                self._write(batch)
+                return
+            if record is not None:
+                batch.append(record)
+            if len(batch) >= self.batch_size or (batch and time.monotonic() >= deadline):
+                self._write(batch)
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._maybe_rotate()
+            lines = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in batch)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+            self.written += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"Event log write failed ({len(batch)} records): {e}")
 
-file_path = os.path.join(eval_dir, "query_answer_result.jsonl")
+    def _file_started(self):
+        """Start time of a file left by an earlier run: its first record's timestamp, else its mtime"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return datetime.fromisoformat(json.loads(f.readline())["timestamp"]).timestamp()
+        except (OSError, ValueError, KeyError, TypeError):
+            return os.path.getmtime(self.path)
 
+    def _maybe_rotate(self):
+        if not os.path.exists(self.path):
+            self._opened_at = time.time()
+            return
+        if self._opened_at is None:
+            self._opened_at = self._file_started()
+        too_big = self.max_bytes and os.path.getsize(self.path) >= self.max_bytes
+        too_old = self.rotate_interval and time.time() - self._opened_at >= self.rotate_interval
+        if not (too_big or too_old) or os.path.getsize(self.path) == 0:
+            return
+        root, ext = os.path.splitext(self.path)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        rotated = f"{root}.{stamp}{ext}"
+        suffix = 1
+        while os.path.exists(rotated) or os.path.exists(f"{rotated}.gz"):
+            rotated = f"{root}.{stamp}-{suffix}{ext}"
+            suffix += 1
+        os.replace(self.path, rotated)
+        self._opened_at = time.time()
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(f"{rotated}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
 
-with open(file_path, "w", encoding="utf-8") as f:
-    pass
+    def close(self):
+        """Flush everything queued so far and stop the writer"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
 
-def save_query_answer(user_message, answer, state=None):
-    # Create the data structure
+    def stats(self):
+        return {"written": self.written, "failed": self.failed, "queued": self._queue.qsize()}
+
+
+def _create_event_log():
+    return EventLog(
+        settings.EVENT_LOG_PATH or file_path,
+        flush_interval=settings.EVENT_LOG_FLUSH_INTERVAL,
+        batch_size=settings.EVENT_LOG_BATCH_SIZE,
+        max_bytes=settings.EVENT_LOG_MAX_BYTES,
+        rotate_interval=settings.EVENT_LOG_ROTATE_INTERVAL,
+        compress=settings.EVENT_LOG_COMPRESS,
+    )
+
+
+event_log = _create_event_log()
+atexit.register(event_log.close) # no records lost when the process exits without the server shutdown hook
+
+
+def save_query_answer(user_message, answer, state=None, **fields):
+    """Log one answered turn; extra fields (trace_id, latency_ms, node metrics) go in as top-level keys"""
     data = {
         "timestamp": datetime.now().isoformat(),
         "user_message": user_message,
         "answer": answer
     }
-    
+
     # Add hallucination score as a top-level field if available
     if state and "hallucination_score" in state:
         data["hallucination_score"] = state["hallucination_score"]
@@ -30,10 +153,6 @@ def save_query_answer(user_message, answer, state=None):
         data["state"] = state_copy
     elif state:
         data["state"] = state
-    
 
-    json_line = json.dumps(data, ensure_ascii=False, indent=2)
-    
-    # Always append during the session
-    with open(file_path, "a", encoding="utf-8") as f:
-        f.write(json_line + "\n")
+    data.update(fields)
+    event_log.log(data)
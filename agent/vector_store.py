@@ -0,0 +1,217 @@
+import json
+import os
+from abc import ABC, abstractmethod
+
+import numpy as np
+from config import settings
+from query_filter import candidate_mask, filter_columns, to_milvus_expr
+
+# output fields returned for every hit, same shape for all backends
+OUTPUT_FIELDS = [
+    "text",
+    "state", "date", "crop_type", "planted_area", "production",
+    "dataset_name", "source_url", "data_year"
+]
+
+# dataset metadata, same as notebooks/ingestor.ipynb
+DATASET_METADATA = {
+    "source": "Department of Statistics Malaysia",
+    "dataset_name": "Crop Area and Production by State",
+    "source_url": "https://www.dosm.gov.my",
+    "data_year": "2017-2022",
+}
+
+
+class VectorStore(ABC):
+    """Interface for vector search backends"""
+
+    @abstractmethod
+    def search(self, query_vector, k, query_filter=None):
+        """Return the top-k hits as dicts of OUTPUT_FIELDS plus score, restricted to query_filter when given"""
+
+    @abstractmethod
+    def close(self):
+        """Release the client / files held by the backend"""
+
+
+class MilvusVectorStore(VectorStore):
+    """Zilliz Cloud / Milvus collection"""
+
+    def __init__(self, uri, token, collection_name):
+        from pymilvus import MilvusClient
+
+        self.client = MilvusClient(uri=uri, token=token) # shared, reused by all searches
+        self.collection_name = collection_name
+
+    def search(self, query_vector, k, query_filter=None):
+        results = self.client.search(
+            collection_name=self.collection_name,
+            data=[query_vector],
+            limit=k,
+            filter=to_milvus_expr(query_filter), # scalar filter runs before the ANN search
+            output_fields=[
+                "text",
+
+                "state", "date", "crop_type", "planted_area", "production",
+                "source", "dataset_name", "source_url", "data_year"
+                # "chunk_id", "created_at"
+            ],
+            timeout=settings.SEARCH_TIMEOUT
+        )
+
+        # Return in json format
+        json_results = []
+        for hits in results:
+            for hit in hits:
+                json_results.append({
+                    "text": hit['entity']['text'],
+                    "state": hit['entity']['state'],
+                    "date": hit['entity']['date'],
+                    "crop_type": hit['entity']['crop_type'],
+                    "planted_area": hit['entity']['planted_area'],
+                    "production": hit['entity']['production'],
+                    # "source": hit['entity']['source'],
+                    "dataset_name": hit['entity']['dataset_name'],
+                    "source_url": hit['entity']['source_url'],
+                    "data_year": hit['entity']['data_year'],
+                    # "chunk_id": hit['entity']['chunk_id'],
+                    # "created_at": hit['entity']['created_at'],
+                    "score": hit['distance']
+                })
+
+        return json_results
+
+    def close(self):
+        self.client.close()
+
+
+class LocalVectorStore(VectorStore):
+    """Local store: normalized float32 matrix on a memory-mapped .npy file plus metadata JSON"""
+
+    def __init__(self, directory, faiss_min_rows=settings.LOCAL_FAISS_MIN_ROWS):
+        self.directory = directory
+        self.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "metadata.json"), encoding="utf-8") as f:
+            self.metadata = json.load(f)
+
+        # approximate index only pays off for larger corpora, exact search otherwise
+        self.index = None
+        index_path = os.path.join(directory, "index.faiss")
+        if len(self.metadata) >= faiss_min_rows and os.path.exists(index_path):
+            try:
+                import faiss
+                self.index = faiss.read_index(index_path)
+            except ImportError:
+                print("faiss not installed, using exact search")
+
+        self.columns = filter_columns(self.metadata) # scalar columns for filter pushdown
+
+        print(f"Local vector store loaded: {len(self.metadata)} chunks (faiss: {self.index is not None})")
+
+    def search(self, query_vector, k, query_filter=None):
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        k = min(k, len(self.metadata))
+
+        if query_filter:
+            # filtered candidate sets are small, exact search over them only
+            candidates = np.flatnonzero(candidate_mask(self.columns, query_filter))
+            scores = self.vectors[candidates] @ query
+            order = np.argsort(-scores)[:k]
+            top = [(int(candidates[i]), float(scores[i])) for i in order]
+        elif self.index is not None:
+            scores, ids = self.index.search(query[None, :], k)
+            top = [(int(i), float(s)) for i, s in zip(ids[0], scores[0]) if i >= 0]
+        else:
+            # rows are unit length, so the dot product is the cosine similarity
+            scores = self.vectors @ query
+            ids = np.argpartition(-scores, k - 1)[:k]
+            ids = ids[np.argsort(-scores[ids])]
+            top = [(int(i), float(scores[i])) for i in ids]
+
+        json_results = []
+        for i, score in top:
+            doc = self.metadata[i]
+            json_results.append({field: doc[field] for field in OUTPUT_FIELDS} | {"score": score})
+        return json_results
+
+    def close(self):
+        # drops the memory map of vectors.npy and the faiss index
+        self.vectors = None
+        self.index = None
+
+
+def create_vector_store():
+    """Create the vector store backend selected by settings.VECTOR_BACKEND"""
+    if settings.VECTOR_BACKEND == "local":
+        return LocalVectorStore(settings.LOCAL_VECTOR_DIR)
+    return MilvusVectorStore(settings.ZILLIZ_URL, settings.ZILLIZ_TOKEN, settings.COLLECTION_NAME)
+
+
+def row_to_text(row):
+    return (
+        f"In {row['state']}, on {row['date']}, "
+        f"the crop type is {row['crop_type']} with a planted area of "
+        f"{row['planted_area']} hectares that produced {row['production']} tonnes."
+    )
+
+
+def chunk_dataset(csv_path=settings.DATASET_CSV_PATH):
+    """Chunk the dataset CSV the same way as notebooks/ingestor.ipynb"""
+    import pandas as pd
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    df = pd.read_csv(csv_path)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=50)
+
+    chunks = []
+    for row_number, (_, row) in enumerate(df.iterrows(), start=1):
+        for chunk_text in splitter.split_text(row_to_text(row)):
+            chunks.append({
+                "text": chunk_text,
+
+                # data fields
+                "state": str(row["state"]),
+                "date": str(row["date"]),
+                "crop_type": str(row["crop_type"]),
+                "planted_area": float(row["planted_area"]),
+                "production": float(row["production"]),
+
+                # metadata
+                **DATASET_METADATA,
+                "file_name": os.path.basename(csv_path),
+                "chunk_id": f"chunk_{row_number:06d}",
+            })
+    return chunks
+
+
+def build_local_store(embeddings, csv_path=settings.DATASET_CSV_PATH, directory=settings.LOCAL_VECTOR_DIR):
+    """Chunk and embed the dataset CSV and write a local store, plus the lexical index over the same chunks"""
+    from lexical_index import BM25Index
+
+    chunks = chunk_dataset(csv_path)
+    vectors = np.asarray(embeddings.embed_documents([chunk["text"] for chunk in chunks]), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, "vectors.npy"), vectors)
+    with open(os.path.join(directory, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump(chunks, f, ensure_ascii=False)
+
+    if len(chunks) >= settings.LOCAL_FAISS_MIN_ROWS:
+        try:
+            import faiss
+            index = faiss.IndexHNSWFlat(vectors.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+            index.add(vectors)
+            faiss.write_index(index, os.path.join(directory, "index.faiss"))
+        except ImportError:
+            print("faiss not installed, skipping HNSW index")
+
+    print(f"Local vector store written to {directory}: {len(chunks)} chunks, dim {vectors.shape[1]}")
+    BM25Index(chunks).save(settings.LEXICAL_INDEX_PATH)
+
+
+if __name__ == "__main__":
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    build_local_store(HuggingFaceEmbeddings(model_name=settings.EMBEDDING_MODEL))
@@ -0,0 +1,318 @@
+"""Offline end-to-end benchmark of the agent graph.
+
+Replays the logged eval queries (one conversation) and the Gradio examples (one session each) through
+create_graph() with local stand-ins for every network dependency (bench/stubs.py), then reports end-to-end and
+per-node latency, llm calls / tokens and peak memory, and compares them against bench/baseline.json.
+
+    uv run bench/run_bench.py                       # compare with the baseline, exit 1 on a regression
+    uv run bench/run_bench.py --llm-latency-ms 400  # simulate provider latency
+    uv run bench/run_bench.py --update-baseline
+    uv run bench/run_bench.py --cassette eval/cassettes/cassette.jsonl.gz --replay-latency
+"""
+import argparse
+import ast
+import asyncio
+import glob
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, "bench", "baseline.json")
+CSV_OUTPUT_PATTERN = os.path.join(ROOT, "database", "user-database", "bench_export_*.csv")
+
+sys.path.insert(0, os.path.join(ROOT, "agent"))
+
+
+def configure(workdir, caches, cassette=None, replay_latency=False):
+    """Local backends and scratch paths, applied before the agent modules read their settings"""
+    from config import settings
+
+    settings.VECTOR_BACKEND = "local"
+    settings.LOCAL_VECTOR_DIR = os.path.join(workdir, "vector-store")
+    settings.LEXICAL_INDEX_PATH = os.path.join(workdir, "lexical-index.json")
+    settings.CHECKPOINT_BACKEND = "memory"
+    settings.EVENT_LOG_PATH = os.path.join(workdir, "query_answer_result.jsonl")
+    settings.METRICS_JSONL_PATH = os.path.join(workdir, "node_metrics.jsonl")
+    settings.WARM_UP_ON_START = False
+    # caches are off by default so every pass measures the full pipeline; with --caches they live in workdir
+    settings.EMBEDDING_CACHE_ENABLED = caches
+    settings.EMBEDDING_CACHE_PATH = os.path.join(workdir, "embeddings.sqlite3")
+    settings.ANSWER_CACHE_ENABLED = caches
+    settings.ANSWER_CACHE_PATH = os.path.join(workdir, "answers.sqlite3")
+    settings.LLM_CACHE_BACKEND = "memory" if caches else "none"
+    settings.OPENAI_API_KEY = settings.OPENAI_API_KEY or "bench"
+    if cassette:
+        # recorded llm responses and tool results instead of the scripted stand-ins
+        settings.CASSETTE_MODE = "replay"
+        settings.CASSETTE_PATH = cassette
+        settings.CASSETTE_REPLAY_LATENCY = replay_latency
+    return settings
+
+
+def gradio_examples(path=os.path.join(ROOT, "agent", "main.py")):
+    """The examples list of the chat UI, read from the source (importing main needs gradio)"""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.keyword) and node.arg == "examples":
+            return ast.literal_eval(node.value)
+    return []
+
+
+def load_sessions(limit=None):
+    """(session name, queries) pairs: the eval log replays as one conversation (it has follow-ups like
+    'yes please'), every Gradio example is a fresh session"""
+    from utils.eval_data import read_records
+
+    records = read_records(os.path.join(ROOT, "eval", "queries_with_results.jsonl"))
+    sessions = [("eval_log", [record["user_message"] for record in records if record.get("user_message")])]
+    sessions += [(f"example_{i:02d}", [query]) for i, query in enumerate(gradio_examples())]
+    if limit:
+        sessions = [(name, queries[:limit]) for name, queries in sessions[:limit]]
+    return sessions
+
+
+async def run_session(graph, name, queries, run, results, semaphore):
+    from graph import build_initial_state
+    from instrumentation import node_metrics
+
+    config = {"configurable": {"thread_id": f"bench_{name}_{run}"}}
+    async with semaphore:
+        for query in queries:
+            state = build_initial_state(query)
+            started = time.perf_counter()
+            error = None
+            try:
+                await graph.ainvoke(state, config)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            wall = time.perf_counter() - started
+            trace = node_metrics.finish_request(state["trace_id"], wall, bench_session=name, error=error)
+            results.append({
+                "session": name, "query": query, "wall_ms": wall * 1000, "error": error,
+                "llm_calls": trace.get("llm_calls", 0),
+                "prompt_tokens": trace.get("prompt_tokens", 0),
+                "completion_tokens": trace.get("completion_tokens", 0),
+            })
+
+
+async def run_pass(graph, sessions, run, concurrency):
+    import nodes
+
+    results = []
+    semaphore = asyncio.Semaphore(concurrency)
+    await asyncio.gather(*(run_session(graph, name, queries, run, results, semaphore) for name, queries in sessions))
+    # POST_CHECKS_MODE=background leaves checks running after the answer
+    await asyncio.gather(*list(nodes._background_tasks), return_exceptions=True)
+    return results
+
+
+def _quantiles(values):
+    from instrumentation import _quantile
+
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+    return {
+        "p50": round(_quantile(ordered, 0.5), 2),
+        "p95": round(_quantile(ordered, 0.95), 2),
+        "p99": round(_quantile(ordered, 0.99), 2),
+        "mean": round(sum(ordered) / len(ordered), 2),
+    }
+
+
+def build_report(args, results, node_summary, peak_bytes):
+    return {
+        "config": {
+            "llm_latency_ms": args.llm_latency_ms, "llm_per_token_ms": args.llm_per_token_ms,
+            "repeat": args.repeat, "concurrency": args.concurrency, "caches": args.caches,
+            "cassette": args.cassette,
+        },
+        "requests": len(results),
+        "errors": sum(1 for result in results if result["error"]),
+        "end_to_end_ms": _quantiles([result["wall_ms"] for result in results]),
+        # deterministic with the fake llm: any change comes from the graph itself
+        "llm_calls": sum(result["llm_calls"] for result in results),
+        "prompt_tokens": sum(result["prompt_tokens"] for result in results),
+        "completion_tokens": sum(result["completion_tokens"] for result in results),
+        "nodes": {
+            node: {
+                "runs": int(stats.get("runs", 0)),
+                "p50_ms": stats["p50_ms"],
+                "p95_ms": stats["p95_ms"],
+                "llm_calls": int(stats.get("llm_calls", 0)),
+            }
+            for node, stats in sorted(node_summary.items())
+        },
+        "memory": {
+            "peak_traced_mb": round(peak_bytes / 2**20, 2) if peak_bytes is not None else None,
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1), # KiB on Linux
+        },
+    }
+
+
+def compare(report, baseline, tolerance, min_ms):
+    """Regressions against the baseline: latency over tolerance (and min_ms), more llm calls / tokens, more memory"""
+    regressions = []
+
+    def check_latency(name, current, previous):
+        if previous is not None and current > previous * (1 + tolerance) and current - previous > min_ms:
+            regressions.append(f"{name}: {previous:.1f} -> {current:.1f} ms")
+
+    for quantile in ("p50", "p95"):
+        check_latency(f"end-to-end {quantile}", report["end_to_end_ms"][quantile],
+                      baseline["end_to_end_ms"].get(quantile))
+    for node, stats in report["nodes"].items():
+        previous = baseline["nodes"].get(node)
+        if previous:
+            check_latency(f"{node} p95", stats["p95_ms"], previous["p95_ms"])
+
+    # counts are compared per request, --repeat and --limit change the totals
+    for counter in ("llm_calls", "prompt_tokens", "completion_tokens"):
+        current = report[counter] / max(report["requests"], 1)
+        previous = baseline[counter] / max(baseline["requests"], 1)
+        if current > previous * 1.001:
+            regressions.append(f"{counter} per request: {previous:.2f} -> {current:.2f}")
+
+    current, previous = report["memory"]["peak_traced_mb"], baseline["memory"].get("peak_traced_mb")
+    if current is not None and previous and current > previous * (1 + tolerance):
+        regressions.append(f"peak traced memory: {previous:.1f} -> {current:.1f} MB")
+    return regressions
+
+
+def print_report(report, baseline=None):
+    e2e = report["end_to_end_ms"]
+    print(f"\nrequests: {report['requests']} (errors: {report['errors']})")
+    print(f"end-to-end ms: p50 {e2e['p50']}  p95 {e2e['p95']}  p99 {e2e['p99']}  mean {e2e['mean']}")
+    print(f"llm calls: {report['llm_calls']}  prompt tokens: {report['prompt_tokens']}  "
+          f"completion tokens: {report['completion_tokens']}")
+    print(f"memory: peak traced {report['memory']['peak_traced_mb']} MB, max rss {report['memory']['max_rss_mb']} MB")
+    if "cassette" in report:
+        print(f"cassette: {report['cassette']}")
+
+    print(f"\n{'node':<34}{'runs':>6}{'p50 ms':>10}{'p95 ms':>10}{'llm':>6}{'base p95':>10}")
+    for node, stats in report["nodes"].items():
+        previous = ((baseline or {}).get("nodes") or {}).get(node)
+        base = f"{previous['p95_ms']:.1f}" if previous else "-"
+        print(f"{node:<34}{stats['runs']:>6}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['llm_calls']:>6}{base:>10}")
+
+
+async def main(args, workdir):
+    configure(workdir, args.caches, args.cassette, args.replay_latency)
+    import stubs
+    from graph import create_graph
+    from instrumentation import node_metrics
+    from retriever import close_retriever
+    from nodes import answer_cache
+    from utils.logger import event_log
+
+    stubs.install_local_retriever(os.path.join(workdir, "vector-store"))
+    transport = None
+    if not args.cassette:
+        stubs.install_inprocess_tools()
+        transport = stubs.install_fake_llm(args.llm_latency_ms, args.llm_per_token_ms)
+
+    graph = await create_graph()
+    sessions = load_sessions(args.limit)
+    print(f"Benchmark: {sum(len(queries) for _, queries in sessions)} queries in {len(sessions)} sessions, "
+          f"{args.repeat} runs after {args.warmup} warm-up")
+
+    try:
+        # first runs load the vector store, the lexical index and the classifier centroids
+        for run in range(args.warmup):
+            await run_pass(graph, sessions, f"warmup{run}", args.concurrency)
+        node_metrics.reset()
+
+        results = []
+        for run in range(args.repeat):
+            results += await run_pass(graph, sessions, run, args.concurrency)
+        node_summary = node_metrics.summary()
+
+        # separate pass, tracemalloc slows every allocation down
+        peak_bytes = None
+        if not args.no_memory:
+            tracemalloc.start()
+            await run_pass(graph, sessions, "memory", args.concurrency)
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    finally:
+        close_retriever()
+        answer_cache.close()
+        node_metrics.close()
+        event_log.close()
+        for path in glob.glob(CSV_OUTPUT_PATTERN):
+            os.remove(path)
+
+    report = build_report(args, results, node_summary, peak_bytes)
+    if transport is not None:
+        report["fake_llm_requests"] = transport.calls
+    else:
+        from utils.cassette import cassette
+        report["cassette"] = cassette.stats()
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the agent graph")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="fixed delay of every fake llm call")
+    parser.add_argument("--llm-per-token-ms", type=float, default=0.0, help="extra delay per completion token")
+    parser.add_argument("--repeat", type=int, default=3, help="measured runs over all sessions")
+    parser.add_argument("--warmup", type=int, default=1, help="runs discarded before measuring")
+    parser.add_argument("--concurrency", type=int, default=1, help="sessions in flight")
+    parser.add_argument("--limit", type=int, default=None, help="first N sessions / queries per session only")
+    parser.add_argument("--caches", action="store_true", help="enable the embedding, llm and answer caches")
+    parser.add_argument("--cassette", help="replay llm and tool calls from a recorded cassette (CASSETTE_MODE=record)")
+    parser.add_argument("--replay-latency", action="store_true", help="sleep the recorded latencies in replay")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--baseline", help=f"default {os.path.relpath(BASELINE_PATH, ROOT)} (scripted stand-ins only)")
+    parser.add_argument("--update-baseline", action="store_true", help="write this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown")
+    parser.add_argument("--min-ms", type=float, default=5.0, help="slowdowns below this are noise")
+    parser.add_argument("--output", help="write the full report as JSON")
+    args = parser.parse_args()
+    if args.baseline is None and args.cassette and args.update_baseline:
+        parser.error("--update-baseline with --cassette needs its own --baseline file")
+    # a cassette replays other responses than the scripted llm, its numbers are only compared to its own baseline
+    if args.baseline is None and not args.cassette:
+        args.baseline = BASELINE_PATH
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.chdir(ROOT) # settings use paths relative to the repo root
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    try:
+        report = asyncio.run(main(args, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = None
+    if args.baseline and os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+    elif baseline is not None:
+        regressions = compare(report, baseline, args.tolerance, args.min_ms)
+        if regressions:
+            print("\nRegressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline")